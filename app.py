@@ -3,28 +3,78 @@
 支持 WebSocket 实时双向通信,基于 FunASR 进行中文语音识别
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from funasr import AutoModel
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+import io
 import json
 import base64
+import copy
 import numpy as np
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+import random
 import time
 import asyncio
+import atexit
+import heapq
+import hmac
+import inspect
+import itertools
+import math
+import multiprocessing
+import sys
+import threading
+import traceback
+from collections import Counter as CollectionsCounter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
 from config import config
 
+if TYPE_CHECKING:
+    # funasr（及 torch）导入耗时较长，在加载模型时才导入，服务端口可以先开放
+    from funasr import AutoModel
+
 # ==================== 日志配置 ====================
+# 事件循环中只把日志记录放入队列，格式化、控制台输出和文件写入（含轮转）都在后台线程中执行
 os.makedirs('logs', exist_ok=True)
 
 logger = logging.getLogger("asr_service")
 logger.setLevel(getattr(logging, config.LOG_LEVEL))
 
+# 识别记录（JSON Lines），写入单独的文件，不输出到常规日志
+recognition_logger = logging.getLogger("asr_service.recognition")
+recognition_logger.setLevel(logging.INFO)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """日志记录原样放入队列，消息在后台线程中格式化（日志参数须为不再修改的值）"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """将日志记录的 fields 字段格式化为一行 JSON"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(
+            {"time": self.formatTime(record), **getattr(record, "fields", {})},
+            ensure_ascii=False
+        )
+
+
+def _is_service_log(record: logging.LogRecord) -> bool:
+    return record.name != recognition_logger.name
+
+
 # 文件处理器（自动轮转）
 file_handler = RotatingFileHandler(
     config.LOG_FILE,
@@ -35,14 +85,50 @@ file_handler = RotatingFileHandler(
 file_handler.setFormatter(logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 ))
-logger.addHandler(file_handler)
+file_handler.addFilter(_is_service_log)
 
 # 控制台处理器
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter(
     '%(asctime)s - %(levelname)s - %(message)s'
 ))
-logger.addHandler(console_handler)
+console_handler.addFilter(_is_service_log)
+
+log_handlers: List[logging.Handler] = [file_handler, console_handler]
+
+# 识别记录处理器（可选）
+if config.RECOGNITION_LOG_FILE:
+    recognition_handler = RotatingFileHandler(
+        config.RECOGNITION_LOG_FILE,
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    recognition_handler.setFormatter(JsonFormatter())
+    recognition_handler.addFilter(lambda record: not _is_service_log(record))
+    log_handlers.append(recognition_handler)
+
+queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+logger.addHandler(queue_handler)
+log_listener: Optional[QueueListener] = None
+
+
+def start_log_listener():
+    """启动日志后台线程（fork 出的工作进程不继承线程，需使用新队列重新启动）"""
+    global log_listener
+    queue_handler.queue = queue.SimpleQueue()
+    log_listener = QueueListener(queue_handler.queue, *log_handlers, respect_handler_level=True)
+    log_listener.start()
+
+
+def stop_log_listener():
+    """写出队列中剩余的日志并停止后台线程"""
+    if log_listener is not None:
+        log_listener.stop()
+
+
+start_log_listener()
+atexit.register(stop_log_listener)
 
 # ==================== FastAPI 应用 ====================
 app = FastAPI(
@@ -55,98 +141,3172 @@ app = FastAPI(
 # 存储 WebSocket 连接
 connections: Dict[int, WebSocket] = {}
 
-# 全局 FunASR 模型实例（应用启动时加载并常驻内存）
-asr_model: Optional[AutoModel] = None
+# 存储识别会话
+sessions: Dict[int, "ASRSession"] = {}
+
+# 全局 FunASR 模型实例（应用启动时加载并常驻内存；ONNX 后端为 OnnxStreamingModel）
+asr_model: Optional[Union["AutoModel", "OnnxStreamingModel"]] = None
+
+# 模型状态：not_loaded / loading / warming_up / ready / failed，仅 ready 时接受识别请求
+model_status: str = "not_loaded"
+
+# 可选的 fsmn-vad 模型（离线转写时用于切分长音频）
+vad_model: Optional["AutoModel"] = None
+
+# 可选的两遍识别离线模型（如 paraformer-zh），stop 后对整段话语识别一次作为最终结果
+offline_model: Optional["AutoModel"] = None
+
+# 可选的最终结果后处理模型：ct-punc 标点恢复模型和逆文本正则化器
+punc_model: Optional["AutoModel"] = None
+text_normalizer = None
+
+# 实际加载的识别模型（模型名、本地目录或快照路径，加载完成后设置）
+loaded_model: Optional[str] = None
+
+# 后台模型加载任务（BACKGROUND_MODEL_LOAD 时创建）
+model_loader: Optional[asyncio.Task] = None
+
+# 全局推理执行器（应用启动时创建）
+inference_executor: Optional["InferenceExecutor"] = None
+
+# 全局动态微批处理器（应用启动时创建）
+inference_batcher: Optional["InferenceBatcher"] = None
+
+# 全局结果后处理器（应用启动时创建）
+postprocessor: Optional["PostProcessor"] = None
+
+
+# ==================== 监控指标（Prometheus）====================
+# 各处理阶段耗时
+DECODE_SECONDS = Histogram(
+    "asr_audio_decode_seconds",
+    "音频帧解码耗时（base64 解码、静音门限、写入缓冲区）",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+INFERENCE_QUEUE_WAIT_SECONDS = Histogram(
+    "asr_inference_queue_wait_seconds",
+    "推理请求在推理线程池中的排队等待时间",
+    ["priority"]
+)
+DECODE_PASS_SECONDS = Histogram(
+    "asr_decode_pass_seconds",
+    "各遍识别的推理计算耗时（first_pass 为流式识别，second_pass 为两遍识别的离线识别）",
+    ["pass"]
+)
+POSTPROCESS_SECONDS = Histogram(
+    "asr_postprocess_seconds",
+    "最终结果后处理耗时",
+    ["stage"]
+)
+GENERATE_SECONDS = Histogram(
+    "asr_generate_seconds",
+    "模型推理（generate）耗时"
+)
+SESSION_LAG_SECONDS = Histogram(
+    "asr_session_lag_seconds",
+    "开始识别时会话积压的未识别音频时长",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0)
+)
+SEND_SECONDS = Histogram(
+    "asr_send_seconds",
+    "WebSocket 消息发送耗时",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+
+# 计数器
+AUDIO_SECONDS_TOTAL = Counter(
+    "asr_audio_seconds_total",
+    "接收的音频总时长（秒）"
+)
+RECOGNITIONS_TOTAL = Counter(
+    "asr_recognitions_total",
+    "返回的识别结果数",
+    ["mode"]
+)
+ERRORS_TOTAL = Counter(
+    "asr_errors_total",
+    "返回给客户端的错误数",
+    ["code"]
+)
+REJECTED_CONNECTIONS_TOTAL = Counter(
+    "asr_rejected_connections_total",
+    "被拒绝的 WebSocket 连接数",
+    ["reason"]
+)
+
+# 准入控制
+ADMISSION_WAIT_SECONDS = Histogram(
+    "asr_admission_wait_seconds",
+    "录音请求在准入队列中的等待时间",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+ADMISSION_REJECTED_TOTAL = Counter(
+    "asr_admission_rejected_total",
+    "未能获得录音名额的请求数",
+    ["reason"]
+)
+
+# 事件循环
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "asr_event_loop_lag_seconds",
+    "事件循环延迟（定时探测的实际唤醒时间与预期时间之差）",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+EVENT_LOOP_STALLS_TOTAL = Counter(
+    "asr_event_loop_stalls_total",
+    "事件循环阻塞超过 SLOW_CALLBACK_MS 的次数"
+)
+
+# 会话数（多进程模式下汇总所有存活工作进程）
+ACTIVE_SESSIONS = Gauge("asr_active_sessions", "当前活跃会话数", multiprocess_mode="livesum")
+RECORDING_SESSIONS = Gauge("asr_recording_sessions", "当前正在录音的会话数", multiprocess_mode="livesum")
+WAITING_SESSIONS = Gauge("asr_waiting_sessions", "排队等待录音名额的会话数", multiprocess_mode="livesum")
+
+
+# ==================== 连接数限制 ====================
+class ConnectionLimiter:
+    """
+    全局名额限制 - 多进程模式下所有工作进程共享同一个计数（用于连接数和录音会话数）
+    
+    计数保存在 fork 之前创建的共享内存中，每个工作进程占用一个槽位；
+    工作进程异常退出时启动器清零其槽位，避免名额泄漏。
+    """
+    
+    def __init__(self, limit: int, num_workers: int = 1):
+        self.limit = limit
+        self._counts = multiprocessing.Array("i", max(1, num_workers))
+        # 当前进程使用的槽位（由启动器在 fork 后设置）
+        self.worker_index = 0
+    
+    @property
+    def total(self) -> int:
+        """所有工作进程的连接总数"""
+        with self._counts.get_lock():
+            return sum(self._counts)
+    
+    def try_acquire(self) -> bool:
+        """占用一个连接名额，已达上限时返回 False"""
+        with self._counts.get_lock():
+            if sum(self._counts) >= self.limit:
+                return False
+            self._counts[self.worker_index] += 1
+            return True
+    
+    def release(self):
+        """释放一个连接名额"""
+        with self._counts.get_lock():
+            self._counts[self.worker_index] -= 1
+    
+    def reset_worker(self, worker_index: int):
+        """清零指定工作进程的连接计数（工作进程退出后由启动器调用）"""
+        with self._counts.get_lock():
+            self._counts[worker_index] = 0
+
+
+connection_limiter = ConnectionLimiter(config.MAX_CONNECTIONS, config.WORKERS)
+recording_limiter = ConnectionLimiter(config.MAX_RECORDING_SESSIONS, config.WORKERS)
+
+
+# ==================== 推理后端 ====================
+class OnnxStreamingModel:
+    """
+    ONNX Runtime 推理后端 - 以 AutoModel.generate 相同的接口封装 funasr_onnx 流式 paraformer
+    
+    模型缓存保存在调用方传入的 cache 字典中；输入超过一个块长时按块长切分依次推理。
+    不传入 cache 时每段音频独立识别。不支持批量推理（批处理器会退化为逐条推理），不支持热词。
+    
+    funasr_onnx 的在线特征提取器（WavFrontendOnline）保存跨块的波形和拼帧缓存，属于单条音频流的状态：
+    每条音频流在 cache 中持有自己的特征提取器副本，推理时使用共享 ONNX 会话的浅拷贝模型对象，
+    多个会话和推理线程并发识别时互不干扰。
+    """
+    
+    def __init__(
+        self,
+        model_dir: str,
+        chunk_size: list,
+        quantize: bool = True,
+        intra_op_threads: int = 1,
+        inter_op_threads: int = 1
+    ):
+        from funasr_onnx.paraformer_online_bin import Paraformer
+        
+        options = {
+            "model_dir": model_dir,
+            "batch_size": 1,
+            "chunk_size": chunk_size,
+            "quantize": quantize,
+            "intra_op_num_threads": intra_op_threads
+        }
+        # 旧版本 funasr_onnx 不支持设置算子间线程数（默认顺序执行模式下不使用该线程池）
+        if "inter_op_num_threads" in inspect.signature(Paraformer.__init__).parameters:
+            options["inter_op_num_threads"] = inter_op_threads
+        elif inter_op_threads != 1:
+            logger.warning("当前 funasr_onnx 版本不支持设置算子间线程数，已忽略 ONNX_INTER_OP_THREADS")
+        
+        self.model = Paraformer(**options)
+        # 未使用过的特征提取器，作为每条音频流的初始状态
+        self._frontend = copy.deepcopy(self.model.frontend)
+        # chunk_size[1] 为每块的帧数，每帧 60ms（16kHz 下 960 个采样点）
+        self.chunk_stride = chunk_size[1] * 960
+    
+    @staticmethod
+    def _text(results: list) -> str:
+        """提取识别文本（funasr_onnx 各版本返回的 preds 为字符串或 (文本, 词列表)）"""
+        if not results:
+            return ""
+        preds = results[0].get("preds", "")
+        if isinstance(preds, str):
+            return preds
+        return preds[0] if preds else ""
+    
+    def generate(self, input=None, cache: Optional[dict] = None, is_final: bool = False, **kwargs) -> list:
+        if isinstance(input, list):
+            raise NotImplementedError("ONNX 后端不支持批量推理")
+        if cache is None:
+            cache, is_final = {}, True
+        if not cache:
+            cache["model"] = {}
+            cache["frontend"] = copy.deepcopy(self._frontend)
+        
+        # 浅拷贝共享 ONNX 会话（onnxruntime 的 run 可并发调用），只替换为本音频流的特征提取器
+        model = copy.copy(self.model)
+        model.frontend = cache["frontend"]
+        
+        audio = np.asarray(input if input is not None else [], dtype=np.float32)
+        offsets = range(0, len(audio), self.chunk_stride) if len(audio) else [0]
+        text = ""
+        for offset in offsets:
+            last = offset + self.chunk_stride >= len(audio)
+            results = model(
+                audio_in=audio[offset:offset + self.chunk_stride],
+                param_dict={"cache": cache["model"], "is_final": is_final and last}
+            )
+            text += self._text(results)
+        return [{"key": "onnx", "text": text}]
+
+
+# ==================== 热词 ====================
+class HotwordSet:
+    """
+    热词表 - 创建时去重并构建 generate 的 hotword 参数
+    
+    FunASR 热词模型（SeACo/Contextual Paraformer）通过 generate 的 hotword 参数接收空格分隔的热词字符串。
+    这里只是原样传递：热词的分词和偏置编码由模型在每次 generate 调用中完成，AutoModel 没有复用编码结果的接口。
+    参数字典只构建一次，批处理器按参数分组时相同热词表的请求可以合并。
+    空热词表也显式传入 hotword=None：模型参数只会被更新、不会被删除，省略该参数时可能沿用其他会话的热词。
+    """
+    
+    def __init__(self, name: str, words: List[str]):
+        self.name = name
+        # 保留首次出现的顺序去重；热词内部的空白会被模型当作分隔符，统一拆分
+        self.words: Tuple[str, ...] = tuple(dict.fromkeys(
+            part for word in words for part in str(word).split()
+        ))
+        self.generate_kwargs: dict = {"hotword": " ".join(self.words) if self.words else None}
+
+
+class HotwordRegistry:
+    """命名热词表注册中心（默认表来自 HOTWORDS，其余来自 HOTWORD_SETS_FILE）"""
+    
+    DEFAULT = "default"
+    
+    def __init__(self):
+        self._sets: Dict[str, HotwordSet] = {}
+        self.register(self.DEFAULT, config.HOTWORDS)
+    
+    @property
+    def default(self) -> HotwordSet:
+        return self._sets[self.DEFAULT]
+    
+    def register(self, name: str, words: Union[str, List[str]]) -> HotwordSet:
+        """注册（或替换）热词表，words 为热词列表或逗号分隔的字符串"""
+        if isinstance(words, str):
+            words = words.split(",")
+        hotword_set = HotwordSet(name, words)
+        self._sets[name] = hotword_set
+        return hotword_set
+    
+    def load_file(self, path: str):
+        """从 JSON 文件加载命名热词表"""
+        with open(path, encoding="utf-8") as f:
+            sets = json.load(f)
+        if not isinstance(sets, dict):
+            raise ValueError(f"热词表文件格式错误（应为 {{表名: [热词, ...]}}）: {path}")
+        for name, words in sets.items():
+            self.register(name, words)
+        logger.info("已加载 %s 个热词表: %s", len(sets), ", ".join(sets))
+    
+    def get(self, name: Optional[str]) -> HotwordSet:
+        """
+        按名称获取热词表（None 为默认表）
+        
+        Raises:
+            KeyError: 热词表不存在
+        """
+        if name is None:
+            return self.default
+        return self._sets[name]
+    
+    def get_stats(self) -> dict:
+        return {name: len(hotword_set.words) for name, hotword_set in self._sets.items()}
+    
+    @property
+    def has_hotwords(self) -> bool:
+        return any(hotword_set.words for hotword_set in self._sets.values())
+
+
+hotword_registry = HotwordRegistry()
+if config.HOTWORD_SETS_FILE:
+    hotword_registry.load_file(config.HOTWORD_SETS_FILE)
+
+
+# ==================== 模型加载 ====================
+def model_generate(model, **cfg) -> list:
+    """
+    调用模型的 generate（可在多个推理线程中并发调用）
+    
+    FunASR 1.0 的 AutoModel.inference 先把本次调用的参数（cache、is_final、chunk_size、hotword 等）
+    deep_update 进模型共享的 self.kwargs 再推理：多个线程同时识别时会互换缓存和 is_final，
+    且上一次调用留下的参数不会被删除。这里为每次调用传入 self.kwargs 的浅拷贝，各调用的参数互不影响。
+    ONNX 后端和压测桩模型没有 kwargs 属性，直接调用。
+    """
+    shared = getattr(model, "kwargs", None)
+    # 挂载了 VAD 的 AutoModel 走 inference_with_vad，不接受 kwargs 参数（本服务未使用这种组合）
+    if isinstance(shared, dict) and getattr(model, "vad_model", None) is None:
+        cfg["kwargs"] = dict(shared)
+    return model.generate(**cfg)
+
+
+def configured_model() -> str:
+    """配置指定的识别模型：ONNX 模型目录、本地模型目录（MODEL_DIR）或模型名（MODEL_NAME）"""
+    if config.ASR_BACKEND == "onnx":
+        return config.ONNX_MODEL_DIR
+    return config.MODEL_DIR or config.MODEL_NAME
+
+
+def load_torch_model():
+    """
+    加载 FunASR 流式模型
+    
+    依次尝试：反序列化模型快照（MODEL_SNAPSHOT）、从本地目录加载（MODEL_DIR）、按模型名从模型仓库解析（MODEL_NAME）。
+    配置了快照但文件不存在时，正常加载后写入快照，下次启动直接反序列化。
+    """
+    global loaded_model
+    from funasr import AutoModel
+    
+    if config.MODEL_SNAPSHOT and os.path.exists(config.MODEL_SNAPSHOT):
+        import torch
+        # 快照为本服务写入的可信文件，包含完整模型对象（含分词器、前端等），须以非 weights_only 方式反序列化
+        model = torch.load(config.MODEL_SNAPSHOT, map_location=config.DEVICE, weights_only=False)
+        logger.info("✓ 已从模型快照加载: %s", config.MODEL_SNAPSHOT)
+        loaded_model = config.MODEL_SNAPSHOT
+        return model
+    
+    if config.MODEL_DIR:
+        if not os.path.isdir(config.MODEL_DIR):
+            raise FileNotFoundError(f"模型目录不存在: {config.MODEL_DIR}")
+        # 本地目录直接读取配置和权重，不访问模型仓库
+        model = AutoModel(model=config.MODEL_DIR, device=config.DEVICE)
+    else:
+        model = AutoModel(
+            model=config.MODEL_NAME,
+            model_revision=config.MODEL_REVISION,
+            device=config.DEVICE
+        )
+    
+    loaded_model = configured_model()
+    if config.MODEL_SNAPSHOT:
+        save_model_snapshot(model, config.MODEL_SNAPSHOT)
+    return model
+
+
+def save_model_snapshot(model, path: str):
+    """将完整模型对象写入快照文件（先写临时文件再替换，多个进程同时写入也不会产生不完整的快照）"""
+    import torch
+    
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info("✓ 模型快照已写入: %s", path)
+    except Exception as e:
+        logger.warning("模型快照写入失败（不影响服务）: %s", e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_models():
+    """加载 FunASR 模型（及可选的 VAD 模型、两遍识别离线模型和后处理模型）到全局变量"""
+    load_asr_model()
+    load_auxiliary_models()
+
+
+def load_asr_model():
+    """加载 FunASR 识别模型到全局变量"""
+    global asr_model, loaded_model
+    
+    logger.info("正在加载 FunASR 模型（CPU模式，常驻后台）...")
+    try:
+        if config.ASR_BACKEND == "onnx":
+            intra_op_threads = config.ONNX_INTRA_OP_THREADS or config.torch_threads_per_worker()
+            asr_model = OnnxStreamingModel(
+                model_dir=config.ONNX_MODEL_DIR,
+                chunk_size=config.STREAMING_CHUNK_SIZE,
+                quantize=config.ONNX_QUANTIZE,
+                intra_op_threads=intra_op_threads,
+                inter_op_threads=config.ONNX_INTER_OP_THREADS
+            )
+            loaded_model = configured_model()
+            logger.info(
+                f"✓ ONNX 模型加载成功（{'int8 量化' if config.ONNX_QUANTIZE else 'fp32'}，"
+                f"算子内线程 {intra_op_threads}），已常驻后台，等待调用"
+            )
+            if hotword_registry.has_hotwords:
+                logger.warning("ONNX 后端不支持热词，已忽略 HOTWORDS/HOTWORD_SETS_FILE")
+        else:
+            asr_model = load_torch_model()
+            logger.info("✓ FunASR 模型加载成功（CPU模式），已常驻后台，等待调用")
+    except Exception as e:
+        logger.error(f"✗ 模型加载失败: {e}")
+        raise
+
+
+def load_auxiliary_models():
+    """
+    加载可选的 VAD 模型、两遍识别离线模型和后处理模型到全局变量
+    
+    这些模型始终使用 PyTorch 后端，与 ASR_BACKEND 无关；已加载的模型（如由启动器在 fork 前加载）不会重复加载
+    """
+    global vad_model, offline_model, punc_model, text_normalizer
+    
+    # 加载 VAD 模型（可选）
+    if config.VAD_MODEL and vad_model is None:
+        logger.info(f"正在加载 VAD 模型: {config.VAD_MODEL}...")
+        try:
+            from funasr import AutoModel
+            vad_model = AutoModel(
+                model=config.VAD_MODEL,
+                model_revision=config.VAD_MODEL_REVISION,
+                device=config.DEVICE
+            )
+            logger.info("✓ VAD 模型加载成功")
+        except Exception as e:
+            logger.error(f"✗ VAD 模型加载失败: {e}")
+            raise
+    
+    # 加载两遍识别离线模型（可选）
+    if config.TWO_PASS_MODEL and offline_model is None:
+        logger.info(f"正在加载两遍识别离线模型: {config.TWO_PASS_MODEL}...")
+        try:
+            from funasr import AutoModel
+            offline_model = AutoModel(
+                model=config.TWO_PASS_MODEL,
+                model_revision=config.TWO_PASS_MODEL_REVISION,
+                device=config.DEVICE
+            )
+            logger.info("✓ 两遍识别离线模型加载成功")
+        except Exception as e:
+            logger.error(f"✗ 两遍识别离线模型加载失败: {e}")
+            raise
+    
+    # 加载标点恢复模型和逆文本正则化器（可选）
+    if config.PUNC_MODEL and punc_model is None:
+        logger.info(f"正在加载标点模型: {config.PUNC_MODEL}...")
+        try:
+            from funasr import AutoModel
+            punc_model = AutoModel(
+                model=config.PUNC_MODEL,
+                model_revision=config.PUNC_MODEL_REVISION,
+                device=config.DEVICE
+            )
+            logger.info("✓ 标点模型加载成功")
+        except Exception as e:
+            logger.error(f"✗ 标点模型加载失败: {e}")
+            raise
+    
+    if config.ITN_ENABLED and text_normalizer is None:
+        try:
+            from fun_text_processing.inverse_text_normalization.inverse_normalize import InverseNormalizer
+            text_normalizer = InverseNormalizer(lang="zh")
+            logger.info("✓ 逆文本正则化器加载成功")
+        except Exception as e:
+            logger.error(f"✗ 逆文本正则化器加载失败（需安装 fun_text_processing）: {e}")
+            raise
+
+
+async def warm_up_model():
+    """
+    预热推理：每个推理线程各执行一次流式识别
+    
+    首次推理需要初始化算子、分配内存池，耗时远高于稳态；预热后第一个真实请求不再承担这部分开销。
+    预热直接提交到推理线程池，不计入推理延迟统计（否则启动后短时间内会误触发负载保护）。
+    """
+    stride = int(config.STREAMING_CHUNK_SIZE[1] * 0.06 * config.SAMPLE_RATE)
+    # 低幅度噪声（全零输入可能走不到完整的解码路径）
+    audio = (np.random.default_rng(0).standard_normal(stride * 2) * 0.01).astype(np.float32)
+    
+    def _warm_up():
+        model_generate(
+            asr_model,
+            input=audio,
+            cache={},
+            is_final=True,
+            chunk_size=config.STREAMING_CHUNK_SIZE,
+            encoder_chunk_look_back=config.ENCODER_CHUNK_LOOK_BACK,
+            decoder_chunk_look_back=config.DECODER_CHUNK_LOOK_BACK,
+            disable_pbar=True
+        )
+        if offline_model is not None:
+            model_generate(offline_model, input=audio, batch_size=1, disable_pbar=True)
+    
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(inference_executor._executor, _warm_up) for _ in range(config.INFERENCE_WORKERS)),
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        logger.warning("预热推理失败（不影响服务）: %r", errors[0])
+    else:
+        logger.info("✓ 预热推理完成（%d 个推理线程，耗时 %.2fs）", len(results), time.perf_counter() - started)
+
+
+async def prepare_models() -> bool:
+    """
+    准备模型：设置线程数、加载模型（启动器未预加载时）并预热，完成后标记就绪
+    
+    导入 torch/funasr 和加载模型都在后台线程中执行，不阻塞事件循环，期间存活检查正常响应。
+    
+    Returns:
+        是否成功（失败时模型状态为 failed，存活检查返回 503）
+    """
+    global model_status
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    
+    try:
+        # 设置 PyTorch 线程数优化 CPU 性能（ONNX 后端的线程数在创建推理会话时设置）
+        # 已预置且未加载 torch 的模型（如压测桩模型）不需要导入 torch
+        if config.ASR_BACKEND == "torch" and (asr_model is None or "torch" in sys.modules):
+            if await loop.run_in_executor(None, config.setup_torch_threads):
+                logger.info(
+                    f"PyTorch 线程数设置为: {config.torch_threads_per_worker()}"
+                    f"（{config.INFERENCE_WORKERS} 个推理线程）"
+                )
+            else:
+                logger.warning("未安装 torch，跳过 PyTorch 线程数设置")
+        
+        # 多进程模式下已由启动器在 fork 之前加载，工作进程直接共享
+        # ONNX 后端的识别模型由各工作进程自行加载，辅助模型已由启动器加载，load_models 会跳过
+        if asr_model is None:
+            model_status = "loading"
+            await loop.run_in_executor(None, load_models)
+        else:
+            logger.info("✓ 使用启动器预加载的 FunASR 模型（多进程共享）")
+        
+        await loop.run_in_executor(None, inference_batcher.check_batch_support)
+    except Exception as e:
+        model_status = "failed"
+        logger.error(f"✗ 模型准备失败，服务无法就绪: {e}")
+        return False
+    
+    if config.MODEL_WARMUP:
+        model_status = "warming_up"
+        await warm_up_model()
+    
+    model_status = "ready"
+    logger.info("✓ 模型已就绪（准备耗时 %.2fs）", time.perf_counter() - started)
+    return True
 
 
 # ==================== 应用生命周期事件 ====================
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化"""
-    global asr_model
+    global inference_executor, inference_batcher, postprocessor, model_loader
+    
+    logger.info("=" * 60)
+    logger.info("语音实时转录服务启动中...")
+    logger.info(f"部署模式: CPU")
+    logger.info(f"模型: {configured_model()}")
+    logger.info(f"推理后端: {config.ASR_BACKEND}")
+    logger.info(f"最大并发连接: {config.MAX_CONNECTIONS}（{config.WORKERS} 个工作进程共享）")
+    logger.info("=" * 60)
+    
+    # 创建推理执行器，模型推理在独立线程池中运行，不阻塞事件循环
+    inference_executor = InferenceExecutor(
+        max_workers=config.INFERENCE_WORKERS,
+        max_queue_size=config.INFERENCE_QUEUE_SIZE,
+        timeout=config.INFERENCE_TIMEOUT,
+        deadlines_ms=(
+            config.INFERENCE_DEADLINE_FINAL_MS,
+            config.INFERENCE_DEADLINE_FIRST_PARTIAL_MS,
+            config.INFERENCE_DEADLINE_PARTIAL_MS,
+            config.INFERENCE_DEADLINE_OFFLINE_MS
+        ),
+        latency_window=config.SHED_LATENCY_WINDOW_SECONDS
+    )
+    
+    # 创建动态微批处理器，合并多个会话的识别请求
+    inference_batcher = InferenceBatcher(
+        executor=inference_executor,
+        window_ms=config.BATCH_WINDOW_MS,
+        max_batch_size=config.BATCH_MAX_SIZE
+    )
+    inference_batcher.start()
+    if config.STREAMING_ENABLED:
+        logger.info("动态批处理: 流式识别已开启，识别请求不经过批处理器")
+    else:
+        logger.info(
+            "动态批处理: 窗口 %sms，最大批大小 %s", config.BATCH_WINDOW_MS, config.BATCH_MAX_SIZE
+        )
+    
+    # 创建结果后处理器，标点恢复和逆文本正则化在独立线程池中运行，不占用推理线程
+    postprocessor = PostProcessor(max_workers=config.POSTPROCESS_WORKERS)
+    
+    # 启动系统状态采样、事件循环监控和准入控制排队调度
+    system_sampler.start()
+    loop_monitor.start()
+    admission_controller.start()
+    logger.info(
+        f"准入控制: 最多 {config.MAX_RECORDING_SESSIONS} 个会话同时录音，"
+        f"每进程最多排队 {config.ADMISSION_QUEUE_SIZE} 个"
+    )
+    
+    # 加载并预热模型：后台模式下端口立即开放，模型就绪前就绪检查返回 503、识别请求返回 503
+    if config.BACKGROUND_MODEL_LOAD:
+        model_loader = asyncio.create_task(prepare_models())
+        logger.info("模型在后台加载，就绪前 /health/ready 返回 503")
+    elif not await prepare_models():
+        raise RuntimeError("模型加载失败")
+    
+    logger.info("=" * 60)
+    logger.info("服务启动完成，等待 WebSocket 连接...")
+    logger.info(f"WebSocket 端点: ws://{config.HOST}:{config.PORT}/ws/asr")
+    logger.info("=" * 60)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时清理"""
+    logger.info("服务正在关闭...")
+    # 关闭所有 WebSocket 连接
+    for connection_id, websocket in list(connections.items()):
+        try:
+            await websocket.close()
+            logger.info(f"关闭连接: {connection_id}")
+        except:
+            pass
+    connections.clear()
+    if model_loader is not None and not model_loader.done():
+        model_loader.cancel()
+    await admission_controller.stop()
+    await system_sampler.stop()
+    await loop_monitor.stop()
+    if inference_batcher is not None:
+        await inference_batcher.stop()
+    if inference_executor is not None:
+        inference_executor.shutdown()
+    if postprocessor is not None:
+        postprocessor.shutdown()
+    logger.info("服务已关闭")
+
+
+# ==================== 推理执行器 ====================
+class InferenceQueueFull(Exception):
+    """推理队列已满，无法接受新的推理请求"""
+
+
+class InferenceJob:
+    """排队中的推理请求"""
+    
+    __slots__ = (
+        "func", "args", "kwargs", "priority", "owner", "submitted", "future",
+        "seq", "started", "finished", "cancelled", "abandoned"
+    )
+    
+    def __init__(self, func, args: tuple, kwargs: dict, priority: int, owner: Optional[int], future: asyncio.Future):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.owner = owner
+        self.submitted = time.perf_counter()
+        self.future = future
+        # 当前有效的队列条目序号（提升优先级后旧条目作废）
+        self.seq = 0
+        self.started = False
+        self.finished = False
+        self.cancelled = False
+        # 等待方放弃后仍在推理线程中执行时，线程结束时完成的 Future
+        self.abandoned: Optional[asyncio.Future] = None
+
+
+class InferenceExecutor:
+    """
+    推理执行器 - 在独立线程池中按优先级调度模型推理
+    
+    模型推理是同步的 CPU 密集型调用，直接在事件循环中执行会阻塞所有连接。
+    执行器将推理提交到专用线程池，并提供有界队列、单次超时和取消能力。
+    
+    请求先在执行器内按截止时间排队，有空闲推理线程时才取出最早到期的请求交给线程池：
+    截止时间 = 提交时间 + 所属优先级的时间预算（最终结果 < 首个部分结果 < 后续部分结果 < 离线转写）。
+    推理繁忙时刚松开按钮的用户优先拿到最终结果，等待已久的低优先级请求也会因截止时间临近而得到执行。
+    """
+    
+    PRIORITY_FINAL = 0
+    PRIORITY_FIRST_PARTIAL = 1
+    PRIORITY_PARTIAL = 2
+    PRIORITY_OFFLINE = 3
+    PRIORITY_NAMES = ("final", "first_partial", "partial", "offline")
+    
+    def __init__(
+        self,
+        max_workers: int,
+        max_queue_size: int,
+        timeout: float,
+        deadlines_ms: Tuple[float, ...],
+        latency_window: float = 30.0
+    ):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.timeout = timeout
+        # 延迟统计的时间窗口（秒），更早的样本不再参与 p95 计算
+        self.latency_window = latency_window
+        # 各优先级的时间预算（秒）
+        self.deadlines = tuple(ms / 1000.0 for ms in deadlines_ms)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="asr-inference"
+        )
+        # 等待执行的请求：(截止时间, 优先级, 序号, 请求)
+        self._queue: list = []
+        self._seq = itertools.count(1)
+        # 已提交但尚未执行完毕的请求数（排队中 + 执行中）
+        self._pending = 0
+        # 正在推理线程中执行的请求数
+        self._running = 0
+        # 各连接已放弃等待（超时或取消）但仍在推理线程中执行的请求 {连接 ID: {Future}}
+        self._abandoned: Dict[int, set] = {}
+        # 近期推理延迟 (完成时刻, 排队 + 执行耗时)，单位秒，用于负载保护
+        self._latencies: deque = deque(maxlen=256)
+        # 各优先级近期的排队等待时间（秒）
+        self._waits = [deque(maxlen=256) for _ in self.PRIORITY_NAMES]
+        self._wait_counts = [0] * len(self.PRIORITY_NAMES)
+        self.stats = {
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "cancelled": 0,
+            "promoted": 0
+        }
+    
+    @property
+    def pending(self) -> int:
+        """排队中和执行中的推理请求总数"""
+        return self._pending
+    
+    @property
+    def queue_depth(self) -> int:
+        """排队等待执行的推理请求数"""
+        return max(0, self._pending - self.max_workers)
+    
+    def _release(self):
+        self._pending -= 1
+    
+    def _record_latency(self, job: InferenceJob):
+        now = time.perf_counter()
+        self._latencies.append((now, now - job.submitted))
+    
+    def latency_p95(self) -> float:
+        """
+        最近 latency_window 秒内推理延迟的 p95（毫秒）
+        
+        过期样本随时间淘汰：负载保护拒绝新会话后推理请求减少，旧的高延迟样本不会一直把 p95 维持在门限之上。
+        """
+        cutoff = time.perf_counter() - self.latency_window
+        while self._latencies and self._latencies[0][0] < cutoff:
+            self._latencies.popleft()
+        if not self._latencies:
+            return 0.0
+        return float(np.percentile([latency for _, latency in self._latencies], 95)) * 1000
+    
+    def _push(self, job: InferenceJob):
+        job.seq = next(self._seq)
+        deadline = job.submitted + self.deadlines[job.priority]
+        heapq.heappush(self._queue, (deadline, job.priority, job.seq, job))
+    
+    def promote(self, owner: int, priority: int):
+        """
+        提升某个连接尚未开始执行的请求的优先级
+        
+        松开按钮后，最终识别依赖该连接排在前面的部分识别先完成，部分识别随之按最终结果的优先级调度。
+        """
+        for _, _, seq, job in list(self._queue):
+            if job.owner == owner and seq == job.seq and not job.cancelled and priority < job.priority:
+                job.priority = priority
+                self._push(job)
+                self.stats["promoted"] += 1
+    
+    def _dispatch(self):
+        """有空闲推理线程时，按截止时间取出请求提交到线程池"""
+        while self._running < self.max_workers and self._queue:
+            _, _, seq, job = heapq.heappop(self._queue)
+            # 跳过已取消的请求和提升优先级后作废的旧条目
+            if seq != job.seq or job.cancelled:
+                continue
+            
+            job.started = True
+            self._running += 1
+            wait = time.perf_counter() - job.submitted
+            self._waits[job.priority].append(wait)
+            self._wait_counts[job.priority] += 1
+            INFERENCE_QUEUE_WAIT_SECONDS.labels(priority=self.PRIORITY_NAMES[job.priority]).observe(wait)
+            
+            future = self._executor.submit(self._call, job)
+            loop = job.future.get_loop()
+            
+            def _on_done(future, job=job, loop=loop):
+                try:
+                    loop.call_soon_threadsafe(self._finish, job, future)
+                except RuntimeError:
+                    pass
+            
+            future.add_done_callback(_on_done)
+    
+    @staticmethod
+    def _call(job: InferenceJob):
+        started = time.perf_counter()
+        try:
+            return job.func(*job.args, **job.kwargs)
+        finally:
+            GENERATE_SECONDS.observe(time.perf_counter() - started)
+    
+    def _finish(self, job: InferenceJob, future):
+        # 线程真正结束后才释放名额，超时/取消的请求在执行完之前仍占用队列
+        job.finished = True
+        self._running -= 1
+        self._release()
+        if job.abandoned is not None:
+            job.abandoned.set_result(None)
+            waiters = self._abandoned.get(job.owner)
+            if waiters is not None:
+                waiters.discard(job.abandoned)
+                if not waiters:
+                    del self._abandoned[job.owner]
+        if not job.future.done():
+            if future.cancelled():
+                job.future.cancel()
+            elif future.exception() is not None:
+                job.future.set_exception(future.exception())
+            else:
+                job.future.set_result(future.result())
+        self._dispatch()
+    
+    def _abandon(self, job: InferenceJob):
+        """
+        等待方已放弃（超时或取消）：尚未开始执行的请求直接从队列移除
+        
+        已在执行的请求无法中断，记录下来供 wait_abandoned 等待其结束。
+        """
+        if not job.started and not job.cancelled:
+            job.cancelled = True
+            self._release()
+        elif job.started and not job.finished and job.owner is not None:
+            job.abandoned = job.future.get_loop().create_future()
+            self._abandoned.setdefault(job.owner, set()).add(job.abandoned)
+    
+    async def wait_abandoned(self, owner: int):
+        """
+        等待该连接已放弃但仍在推理线程中执行的请求结束
+        
+        超时的流式识别仍占用推理线程，该连接提交下一块或重置状态之前先等待其结束。
+        """
+        waiters = self._abandoned.get(owner)
+        if waiters:
+            await asyncio.wait(set(waiters))
+    
+    async def run(
+        self,
+        func,
+        *args,
+        timeout: Optional[float] = None,
+        priority: int = PRIORITY_OFFLINE,
+        owner: Optional[int] = None,
+        **kwargs
+    ):
+        """
+        在推理线程池中执行函数并等待结果
+        
+        Args:
+            func: 要执行的同步函数（如 model_generate）
+            timeout: 超时时间（秒，含排队时间），默认使用执行器配置
+            priority: 优先级（PRIORITY_*），决定排队的时间预算
+            owner: 提交请求的连接 ID（用于提升优先级）
+            
+        Returns:
+            函数返回值
+            
+        Raises:
+            InferenceQueueFull: 推理队列已满
+            asyncio.TimeoutError: 推理超时
+        """
+        if self.queue_depth >= self.max_queue_size:
+            self.stats["rejected"] += 1
+            raise InferenceQueueFull(f"推理队列已满（{self.max_queue_size}）")
+        
+        job = InferenceJob(func, args, kwargs, priority, owner, asyncio.get_running_loop().create_future())
+        self._pending += 1
+        self._push(job)
+        self._dispatch()
+        
+        try:
+            result = await asyncio.wait_for(job.future, timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            self._record_latency(job)
+            self._abandon(job)
+            raise
+        except asyncio.CancelledError:
+            # 客户端断开等原因取消
+            self.stats["cancelled"] += 1
+            self._abandon(job)
+            raise
+        
+        self.stats["completed"] += 1
+        self._record_latency(job)
+        return result
+    
+    def get_priority_stats(self) -> dict:
+        """各优先级的排队等待时间统计（近期请求，毫秒）"""
+        stats = {}
+        for priority, name in enumerate(self.PRIORITY_NAMES):
+            waits = self._waits[priority]
+            stats[name] = {
+                "count": self._wait_counts[priority],
+                "deadline_ms": round(self.deadlines[priority] * 1000),
+                "wait_p50_ms": round(float(np.percentile(waits, 50)) * 1000, 2) if waits else 0.0,
+                "wait_p95_ms": round(float(np.percentile(waits, 95)) * 1000, 2) if waits else 0.0,
+                "wait_max_ms": round(max(waits) * 1000, 2) if waits else 0.0
+            }
+        return stats
+    
+    def shutdown(self):
+        """关闭线程池，丢弃尚未开始的请求"""
+        for _, _, _, job in self._queue:
+            if not job.future.done():
+                job.future.cancel()
+        self._queue.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class InferenceBatcher:
+    """
+    动态微批处理器 - 合并多个会话的识别请求为一次批量推理
+    
+    在批处理窗口内收集各会话提交的音频块（最多 max_batch_size 个），
+    通过一次 generate 调用完成推理，再按提交顺序将结果分发回各会话。
+    
+    仅适用于关闭流式识别（STREAMING_ENABLED=false）且 MODEL_NAME 为离线非流式模型（如 paraformer-zh）的部署：
+    流式识别的每个会话持有各自的模型缓存，不经过批处理器；paraformer-zh-streaming 等流式模型
+    也无法通过批量推理探测。此时请求逐条提交（经 model_generate，多个推理线程并行执行互不干扰）。
+    """
+    
+    def __init__(self, executor: InferenceExecutor, window_ms: float, max_batch_size: int):
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._dispatcher: Optional[asyncio.Task] = None
+        # 模型是否支持列表输入的批量推理（加载后由 check_batch_support 探测，不支持时逐条提交）
+        self._batch_supported = False
+        # 正在执行的批次任务（保留引用，避免任务在执行中被垃圾回收）
+        self._tasks: set = set()
+        # 实际批大小分布 {批大小: 次数}
+        self.batch_size_histogram: CollectionsCounter = CollectionsCounter()
+    
+    def start(self):
+        """启动批处理调度任务"""
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+    
+    async def stop(self):
+        """停止批处理调度任务"""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for task in list(self._tasks):
+            task.cancel()
+    
+    def check_batch_support(self):
+        """
+        探测当前模型是否支持批量推理（模型加载后在后台线程中调用一次）
+        
+        paraformer-zh-streaming 等流式模型对列表输入会抛出 AssertionError("batch_size must be set 1")，
+        ONNX 后端抛出 NotImplementedError。不支持时每个请求单独提交，由多个推理线程并行执行。
+        """
+        audio = np.zeros(int(0.6 * config.SAMPLE_RATE), dtype=np.float32)
+        try:
+            results = model_generate(asr_model, input=[audio, audio], batch_size=2, disable_pbar=True)
+            self._batch_supported = results is not None and len(results) == 2
+        except Exception as e:
+            logger.info("当前模型不支持批量推理（%s: %s），识别请求将逐条提交", type(e).__name__, e)
+            self._batch_supported = False
+        else:
+            logger.info("✓ 当前模型%s批量推理", "支持" if self._batch_supported else "不支持")
+    
+    async def submit(
+        self,
+        audio: np.ndarray,
+        connection_id: int,
+        priority: int = InferenceExecutor.PRIORITY_OFFLINE,
+        **kwargs
+    ) -> Optional[dict]:
+        """
+        提交单个音频块，等待批量推理完成后返回该音频块的识别结果
+        
+        Args:
+            audio: float32 音频数据
+            connection_id: 提交请求的连接 ID
+            priority: 推理优先级，批次按其中最高的优先级调度
+            **kwargs: 传给 generate 的额外参数，参数相同的请求才会合并
+            
+        Returns:
+            识别结果字典（如 {"text": ...}）或 None
+        """
+        if self._queue.qsize() >= self.executor.max_queue_size:
+            self.executor.stats["rejected"] += 1
+            raise InferenceQueueFull(f"推理队列已满（{self.executor.max_queue_size}）")
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((connection_id, audio, kwargs, future, priority))
+        return await future
+    
+    @staticmethod
+    def _batch_key(kwargs: dict) -> tuple:
+        return tuple(sorted(
+            (k, tuple(v) if isinstance(v, list) else v) for k, v in kwargs.items()
+        ))
+    
+    async def _dispatch_loop(self):
+        """调度循环：按窗口收集请求，按参数分组后提交批量推理"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            # 跳过已取消的请求（如客户端已断开）
+            groups: Dict[tuple, list] = {}
+            for item in batch:
+                if not item[3].done():
+                    groups.setdefault(self._batch_key(item[2]), []).append(item)
+            
+            for items in groups.values():
+                # 模型不支持批量推理时逐条提交，由推理线程池并行执行
+                for chunk in ([items] if self._batch_supported else [[item] for item in items]):
+                    task = asyncio.create_task(self._run_batch(chunk))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+    
+    def _generate_batch(self, inputs: list, kwargs: dict) -> list:
+        """在推理线程中执行批量推理（模型不支持批量时逐条推理）"""
+        if len(inputs) > 1 and self._batch_supported:
+            try:
+                return model_generate(
+                    asr_model,
+                    input=inputs,
+                    batch_size=len(inputs),
+                    disable_pbar=True,
+                    **kwargs
+                )
+            except (NotImplementedError, AssertionError):
+                # 探测结果与实际调用不一致时兜底（如流式模型拒绝 batch_size > 1）
+                self._batch_supported = False
+                logger.warning("当前模型不支持批量推理，已退化为逐条推理")
+        
+        results = []
+        for audio in inputs:
+            result = model_generate(asr_model, input=audio, batch_size=1, disable_pbar=True, **kwargs)
+            results.append(result[0] if result else None)
+        return results
+    
+    async def _run_batch(self, items: list):
+        """执行一个批次并将结果分发给对应的请求"""
+        inputs = [item[1] for item in items]
+        self.batch_size_histogram[len(items)] += 1
+        try:
+            results = await self.executor.run(
+                self._generate_batch,
+                inputs,
+                items[0][2],
+                priority=min(item[4] for item in items)
+            )
+            if not results or len(results) != len(items):
+                raise RuntimeError(
+                    f"批量推理结果数量不匹配（期望 {len(items)}，实际 {len(results or [])}）"
+                )
+        except Exception as e:
+            for _, _, _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        # 结果与输入顺序一致，按顺序路由回各连接
+        for (connection_id, _, _, future, _), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+    
+    def get_stats(self) -> dict:
+        """批处理统计信息"""
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "queued": self._queue.qsize(),
+            "batch_supported": self._batch_supported,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items()))
+        }
+
+
+# ==================== 结果后处理 ====================
+class PostProcessor:
+    """
+    最终结果后处理 - 标点恢复（ct-punc）和逆文本正则化（ITN）
+    
+    后处理在独立线程池中执行，与推理线程池互不占用：上一段话语的最终结果在做后处理时，
+    下一段话语的识别照常进行。只处理最终结果，部分结果原样发送。
+    """
+    
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="asr-postprocess"
+        )
+        self._pending = 0
+        self.stats = {
+            "completed": 0,
+            "errors": 0
+        }
+    
+    @property
+    def enabled(self) -> bool:
+        """是否加载了后处理模型"""
+        return punc_model is not None or text_normalizer is not None
+    
+    def _process(self, text: str) -> Tuple[str, Dict[str, float]]:
+        """在后处理线程中依次执行各阶段，返回处理后的文本和各阶段耗时（毫秒）"""
+        timings = {}
+        if punc_model is not None:
+            started = time.perf_counter()
+            result = model_generate(punc_model, input=text, disable_pbar=True)
+            text = result[0].get("text", text) if result else text
+            elapsed = time.perf_counter() - started
+            POSTPROCESS_SECONDS.labels(stage="punc").observe(elapsed)
+            timings["punc"] = round(elapsed * 1000, 2)
+        
+        if text_normalizer is not None:
+            started = time.perf_counter()
+            text = text_normalizer.inverse_normalize(text, verbose=False)
+            elapsed = time.perf_counter() - started
+            POSTPROCESS_SECONDS.labels(stage="itn").observe(elapsed)
+            timings["itn"] = round(elapsed * 1000, 2)
+        return text, timings
+    
+    async def run(self, text: str) -> Tuple[str, Dict[str, float]]:
+        """
+        对最终结果文本做后处理
+        
+        Returns:
+            (处理后的文本, 各阶段耗时)；未加载后处理模型或文本为空时原样返回
+        """
+        if not self.enabled or not text.strip():
+            return text, {}
+        
+        self._pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, self._process, text)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self._pending -= 1
+        self.stats["completed"] += 1
+        return result
+    
+    def get_stats(self) -> dict:
+        """后处理统计信息"""
+        return {
+            "enabled": self.enabled,
+            "punc_model": config.PUNC_MODEL or None,
+            "itn": text_normalizer is not None,
+            "workers": self.max_workers,
+            "pending": self._pending,
+            **self.stats
+        }
+    
+    def shutdown(self):
+        """关闭后处理线程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ==================== 准入控制 ====================
+class AdmissionController:
+    """
+    准入控制 - 按推理负载限制同时录音的会话数
+    
+    连接数只限制打开的套接字，空闲连接不占用推理资源。会话按下按钮（start）时申请录音名额：
+    有空闲名额且推理负载正常时立即准入，否则进入有界等待队列并收到排队位置和预计等待时间，
+    排队期间音频照常写入会话缓冲区，准入后再开始识别。名额在话语最终结果返回后释放。
+    """
+    
+    # 尚无统计数据时假定的单段话语占用名额时长（秒）
+    DEFAULT_HOLD_SECONDS = 5.0
+    # 排队时检查名额和负载的间隔（秒），其他工作进程释放的名额通过轮询发现
+    POLL_INTERVAL = 0.1
+    
+    def __init__(self, limiter: ConnectionLimiter, max_waiting: int, max_wait: float):
+        self.limiter = limiter
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self._waiting: List["ASRSession"] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # 单段话语占用名额时长的滑动平均，用于估算排队时间
+        self.avg_hold_seconds = self.DEFAULT_HOLD_SECONDS
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected": 0,
+            "timeouts": 0
+        }
+    
+    def start(self):
+        """启动排队调度任务"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._admit_loop())
+    
+    async def stop(self):
+        """停止排队调度任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    @property
+    def waiting(self) -> int:
+        """本进程排队等待的会话数"""
+        return len(self._waiting)
+    
+    def overload_reason(self) -> Optional[str]:
+        """推理负载过高时返回原因，负载正常时返回 None"""
+        if inference_executor is None:
+            return None
+        if config.SHED_QUEUE_DEPTH and inference_executor.queue_depth >= config.SHED_QUEUE_DEPTH:
+            return "queue_depth"
+        # 执行器空闲时近期延迟不代表当前负载
+        if (
+            config.SHED_P95_LATENCY_MS
+            and inference_executor.pending
+            and inference_executor.latency_p95() >= config.SHED_P95_LATENCY_MS
+        ):
+            return "latency"
+        return None
+    
+    def position(self, session: "ASRSession") -> int:
+        """会话的排队位置（从 1 开始），未排队时返回 0"""
+        try:
+            return self._waiting.index(session) + 1
+        except ValueError:
+            return 0
+    
+    def estimated_wait_ms(self, position: int) -> int:
+        """按名额平均占用时长估算排队等待时间（毫秒）"""
+        return int(position * self.avg_hold_seconds / max(1, self.limiter.limit) * 1000)
+    
+    def request(self, session: "ASRSession") -> Optional[int]:
+        """
+        为会话申请录音名额
+        
+        Returns:
+            0 表示已获得名额，正数为排队位置，None 表示排队已满被拒绝
+        """
+        if session.holds_slot:
+            return 0
+        if session in self._waiting:
+            return self.position(session)
+        
+        # 已有会话排队时新请求排在其后，保证先到先得
+        if not self._waiting and self.overload_reason() is None and self.limiter.try_acquire():
+            self.stats["admitted"] += 1
+            session.admit()
+            return 0
+        
+        if len(self._waiting) >= self.max_waiting:
+            self.stats["rejected"] += 1
+            ADMISSION_REJECTED_TOTAL.labels(reason="queue_full").inc()
+            return None
+        
+        self.stats["queued"] += 1
+        self._waiting.append(session)
+        WAITING_SESSIONS.inc()
+        session.enqueue()
+        self._notify()
+        return len(self._waiting)
+    
+    def release(self, session: "ASRSession"):
+        """释放会话占用的名额，或将其移出等待队列"""
+        if session in self._waiting:
+            self._remove(session)
+        if session.holds_slot:
+            held = session.release_slot()
+            self.avg_hold_seconds = 0.8 * self.avg_hold_seconds + 0.2 * held
+            self.limiter.release()
+            self._notify()
+    
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    def _remove(self, session: "ASRSession"):
+        self._waiting.remove(session)
+        WAITING_SESSIONS.dec()
+        self._notify()
+    
+    async def _admit_loop(self):
+        """按先到先得顺序为排队会话分配空闲名额，并通知其余会话新的排队位置"""
+        while True:
+            # 无人排队时等待通知；有人排队时定期轮询（名额可能由其他工作进程释放，负载也会变化）
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait([waiter], timeout=self.POLL_INTERVAL if self._waiting else None)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            if not self._waiting:
+                continue
+            
+            changed = False
+            now = time.time()
+            for session in [s for s in self._waiting if now - s.queued_at > self.max_wait]:
+                if session not in self._waiting:
+                    continue
+                self._remove(session)
+                self.stats["timeouts"] += 1
+                ADMISSION_REJECTED_TOTAL.labels(reason="timeout").inc()
+                await session.admission_timeout()
+                changed = True
+            
+            while self._waiting and self.overload_reason() is None and self.limiter.try_acquire():
+                session = self._waiting[0]
+                self._remove(session)
+                self.stats["admitted"] += 1
+                ADMISSION_WAIT_SECONDS.observe(now - session.queued_at)
+                session.admit()
+                await session.send_safely(session.send_static(STATUS_ADMITTED))
+                changed = True
+            
+            if changed:
+                for position, session in enumerate(self._waiting, start=1):
+                    await session.send_safely(session.send_queue_status(position))
+    
+    def get_stats(self) -> dict:
+        """准入控制统计信息"""
+        return {
+            "max_recording_sessions": self.limiter.limit,
+            "recording_sessions": self.limiter.total,
+            "waiting": len(self._waiting),
+            "max_waiting": self.max_waiting,
+            "avg_hold_s": round(self.avg_hold_seconds, 2),
+            "overload": self.overload_reason(),
+            "inference_p95_ms": round(inference_executor.latency_p95(), 2) if inference_executor else None,
+            **self.stats
+        }
+
+
+admission_controller = AdmissionController(
+    recording_limiter,
+    max_waiting=config.ADMISSION_QUEUE_SIZE,
+    max_wait=config.ADMISSION_TIMEOUT
+)
+
+
+# ==================== 系统状态采样 ====================
+class SystemSampler:
+    """
+    系统状态采样 - 后台任务定期采集 CPU、内存、推理队列和事件循环延迟
+    
+    健康检查和统计接口直接返回最近一次的采样结果，不在请求中阻塞事件循环。
+    CPU 使用率为两次采样之间的平均值（psutil 非阻塞模式）。
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.snapshot: dict = {}
+        self._process = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """启动采样任务"""
+        import psutil
+        
+        self._process = psutil.Process()
+        # 首次调用只建立基准，返回值无意义
+        psutil.cpu_percent(interval=None)
+        self._sample(loop_lag=0.0)
+        self._task = asyncio.create_task(self._sample_loop())
+    
+    async def stop(self):
+        """停止采样任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def _sample(self, loop_lag: float):
+        import psutil
+        
+        memory = psutil.virtual_memory()
+        self.snapshot = {
+            "cpu_usage_percent": psutil.cpu_percent(interval=None),
+            "memory_usage_percent": memory.percent,
+            "process_memory_mb": round(self._process.memory_info().rss / 1024 / 1024, 1),
+            "inference_pending": inference_executor.pending if inference_executor else 0,
+            "inference_queue_depth": inference_executor.queue_depth if inference_executor else 0,
+            "loop_lag_ms": round(loop_lag * 1000, 2),
+            "sampled_at": datetime.now().isoformat()
+        }
+    
+    async def _sample_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 实际唤醒时间与预期时间之差即事件循环延迟
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self._sample(loop_lag=max(0.0, loop.time() - expected))
+
+
+system_sampler = SystemSampler(config.HEALTH_SAMPLE_INTERVAL)
+
+
+def readiness() -> Tuple[bool, Optional[str]]:
+    """
+    是否可以接收新的请求
+    
+    Returns:
+        (是否就绪, 未就绪原因)
+    """
+    if model_status != "ready":
+        return False, f"model_{model_status}"
+    if inference_executor is not None and inference_executor.queue_depth >= inference_executor.max_queue_size:
+        return False, "inference_queue_full"
+    if admission_controller.waiting >= admission_controller.max_waiting:
+        return False, "admission_queue_full"
+    return True, None
+
+
+# ==================== 运行时诊断 ====================
+def format_frame(frame) -> str:
+    """栈帧的折叠栈表示：函数名 (文件名:函数起始行)"""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class LoopMonitor:
+    """
+    事件循环监控 - 定期探测事件循环延迟，可选检测长时间阻塞并记录调用栈
+    
+    探测任务每次唤醒时更新心跳；看门狗线程发现心跳停止超过 SLOW_CALLBACK_MS 时，
+    通过 sys._current_frames() 抓取事件循环线程当前的调用栈（即阻塞事件循环的代码）并写入日志。
+    """
+    
+    def __init__(self, interval: float, stall_threshold_ms: float):
+        self.interval = interval
+        self.stall_threshold = stall_threshold_ms / 1000.0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+    
+    def start(self):
+        """启动探测任务和看门狗线程（阻塞检测开启时）"""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._probe_loop())
+        if self.stall_threshold > 0:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+    
+    async def stop(self):
+        """停止探测任务和看门狗线程"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _probe_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._heartbeat = time.monotonic()
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+    
+    def _watch(self):
+        """看门狗线程：心跳超时即判定事件循环阻塞，每次阻塞只记录一次调用栈"""
+        reported = False
+        check_interval = min(self.interval, self.stall_threshold) / 2
+        while not self._stop.wait(check_interval):
+            blocked = time.monotonic() - self._heartbeat - self.interval
+            if blocked < self.stall_threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            reported = True
+            self.stalls += 1
+            EVENT_LOOP_STALLS_TOTAL.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "（无法获取调用栈）"
+            logger.warning("事件循环已阻塞 %.0fms，当前调用栈:\n%s", blocked * 1000, stack)
+    
+    def get_stats(self) -> dict:
+        """事件循环监控统计信息"""
+        return {
+            "lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "stall_threshold_ms": config.SLOW_CALLBACK_MS,
+            "stalls": self.stalls
+        }
+
+
+loop_monitor = LoopMonitor(config.LOOP_LAG_PROBE_INTERVAL, config.SLOW_CALLBACK_MS)
+
+
+class SamplingProfiler:
+    """
+    采样分析器 - 定时采集所有线程的调用栈，输出折叠栈格式（可直接用于 flamegraph.pl / speedscope）
+    
+    每行为 "线程名;外层函数;...;内层函数 采样次数"。采样在独立线程中进行，不阻塞事件循环。
+    """
+    
+    # 采样间隔（秒）
+    SAMPLE_INTERVAL = 0.005
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+    
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+    
+    def profile(self, seconds: float) -> str:
+        """
+        采样指定时长并返回折叠栈文本（在线程中执行）
+        
+        Raises:
+            RuntimeError: 已有采样在进行中
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("已有采样在进行中")
+        try:
+            own_id = threading.get_ident()
+            stacks: CollectionsCounter = CollectionsCounter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    frames = []
+                    while frame is not None:
+                        frames.append(format_frame(frame))
+                        frame = frame.f_back
+                    frames.append(names.get(thread_id, str(thread_id)))
+                    stacks[";".join(reversed(frames))] += 1
+                time.sleep(self.SAMPLE_INTERVAL)
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+
+sampling_profiler = SamplingProfiler()
+
+
+# ==================== 音频处理器 ====================
+class AudioProcessor:
+    """
+    音频处理器 - 负责音频数据的解码、预处理和缓冲
+    
+    每个会话预分配一个 float32 环形缓冲区（容量为最大话语时长），
+    PCM16 数据直接转换写入缓冲区，识别时返回缓冲区视图，避免逐帧分配内存。
+    """
+    
+    # int16 → [-1, 1] 归一化系数
+    PCM16_SCALE = np.float32(1.0 / 32768.0)
+    
+    def __init__(self, sample_rate: int = 16000, max_seconds: float = 60):
+        self.sample_rate = sample_rate
+        self.capacity = int(sample_rate * max_seconds)
+        self.audio_buffer = np.zeros(self.capacity, dtype=np.float32)
+        # 读取跨越缓冲区末尾时使用的拼接区（按需扩容，仅在回绕时复制）
+        self._scratch = np.empty(0, dtype=np.float32)
+        # 累计写入/读取的采样点数（单调递增，用于标记话语边界）
+        self.samples_written = 0
+        self.samples_read = 0
+        # 此位置之前的数据可被覆盖（最近一次读取返回的视图仍可能在推理中使用）
+        self._retain_from = 0
+        # 两遍识别时保留当前话语的全部音频：此位置之后的数据即使已读取也不会被覆盖
+        self._pinned_from: Optional[int] = None
+        # 因缓冲区已满被丢弃的采样点数
+        self.dropped_samples = 0
+    
+    def decode_audio(self, audio_data: str) -> Optional[bytes]:
+        """
+        解码 base64 音频数据为 PCM16 字节
+        
+        Args:
+            audio_data: base64 编码的音频数据
+            
+        Returns:
+            PCM16 字节或 None（解码失败时）
+        """
+        try:
+            return base64.b64decode(audio_data)
+        except Exception as e:
+            logger.error("音频解码失败: %s", e)
+            return None
+    
+    @property
+    def available(self) -> int:
+        """缓冲区中尚未读取的采样点数"""
+        return self.samples_written - self.samples_read
+    
+    def _reserve(self, num_samples: int) -> Optional[tuple]:
+        """为写入预留空间，返回环形缓冲区中的两段目标视图；空间不足返回 None"""
+        retain_from = self._retain_from if self._pinned_from is None else min(self._retain_from, self._pinned_from)
+        if self.samples_written + num_samples - retain_from > self.capacity:
+            self.dropped_samples += num_samples
+            return None
+        
+        start = self.samples_written % self.capacity
+        first = min(num_samples, self.capacity - start)
+        return (
+            self.audio_buffer[start:start + first],
+            self.audio_buffer[:num_samples - first]
+        )
+    
+    def write_pcm(self, audio_bytes: bytes) -> int:
+        """
+        将 PCM16 字节转换为 float32 并直接写入环形缓冲区
+        
+        Args:
+            audio_bytes: 小端 int16 PCM 数据
+            
+        Returns:
+            写入的采样点数（解码失败或缓冲区已满时为 0）
+        """
+        try:
+            # 直接引用原始字节，不复制
+            pcm = np.frombuffer(audio_bytes, dtype=np.int16)
+        except ValueError as e:
+            logger.error("音频解码失败: %s", e)
+            return 0
+        
+        targets = self._reserve(len(pcm))
+        if targets is None:
+            return 0
+        
+        # 一步完成类型转换和归一化，结果直接写入缓冲区
+        head, tail = targets
+        np.multiply(pcm[:len(head)], self.PCM16_SCALE, out=head, dtype=np.float32)
+        if len(tail):
+            np.multiply(pcm[len(head):], self.PCM16_SCALE, out=tail, dtype=np.float32)
+        
+        self.samples_written += len(pcm)
+        return len(pcm)
+    
+    def write(self, frame: Union[bytes, np.ndarray]) -> int:
+        """写入一帧音频：PCM16 字节（一步转换为 float32）或已转换的 float32 数组（直接复制）"""
+        if isinstance(frame, bytes):
+            return self.write_pcm(frame)
+        return self.append(frame)
+    
+    def append(self, audio_chunk: np.ndarray) -> int:
+        """
+        将 float32 音频写入环形缓冲区
+        
+        Returns:
+            写入的采样点数（缓冲区已满时为 0）
+        """
+        targets = self._reserve(len(audio_chunk))
+        if targets is None:
+            return 0
+        
+        head, tail = targets
+        np.copyto(head, audio_chunk[:len(head)])
+        if len(tail):
+            np.copyto(tail, audio_chunk[len(head):])
+        
+        self.samples_written += len(audio_chunk)
+        return len(audio_chunk)
+    
+    def read(self, num_samples: int) -> np.ndarray:
+        """
+        从缓冲区读取指定数量的采样点
+        
+        返回的数组是缓冲区视图（仅在跨越缓冲区末尾时复制），
+        在下一次读取之前不会被新写入的音频覆盖。
+        
+        Args:
+            num_samples: 读取的采样点数（超出可用数量时只返回可用部分）
+            
+        Returns:
+            float32 音频数组
+        """
+        num_samples = min(num_samples, self.available)
+        start = self.samples_read % self.capacity
+        self._retain_from = self.samples_read
+        self.samples_read += num_samples
+        
+        if start + num_samples <= self.capacity:
+            return self.audio_buffer[start:start + num_samples]
+        
+        if len(self._scratch) < num_samples:
+            self._scratch = np.empty(num_samples, dtype=np.float32)
+        first = self.capacity - start
+        audio = self._scratch[:num_samples]
+        audio[:first] = self.audio_buffer[start:]
+        audio[first:] = self.audio_buffer[:num_samples - first]
+        return audio
+    
+    def peek(self, num_samples: int) -> np.ndarray:
+        """复制缓冲区中接下来的采样点，不移动读取位置"""
+        return self.copy(self.samples_read, self.samples_read + min(num_samples, self.available))
+    
+    def copy(self, start: int, end: int) -> np.ndarray:
+        """复制累计位置 [start, end) 的音频（须仍保留在缓冲区中，如 pin 之后的数据）"""
+        num_samples = end - start
+        offset = start % self.capacity
+        first = min(num_samples, self.capacity - offset)
+        return np.concatenate((
+            self.audio_buffer[offset:offset + first],
+            self.audio_buffer[:num_samples - first]
+        ))
+    
+    def pin(self, position: Optional[int]):
+        """保留累计位置 position 之后的音频不被覆盖（None 表示取消）"""
+        self._pinned_from = position
+    
+    def clear_buffer(self):
+        """清空音频缓冲区"""
+        self.samples_read = self.samples_written
+        self._retain_from = self.samples_written
+        logger.debug("音频缓冲区已清空")
+
+
+# ==================== 音频格式转换 ====================
+class StreamingResampler:
+    """
+    流式多相重采样器 - Kaiser 窗 sinc 低通，按有理数比例 L/M（上采样 L 倍、下采样 M 倍）转换采样率
+    
+    只计算需要输出的采样点：第 k 个输出点位于上采样序列的 k*M 处，
+    由滤波器的第 (k*M mod L) 相与其前的 taps 个输入点做点积，一帧内的所有输出点一次向量化计算。
+    跨帧保留最后 taps-1 个输入点作为滤波历史，分帧处理的结果与整段一次处理相同。
+    """
+    
+    ZERO_CROSSINGS = 16  # 滤波器单侧的 sinc 过零点数
+    ROLLOFF = 0.94  # 截止频率相对较低一侧奈奎斯特频率的比例
+    KAISER_BETA = 8.6
+    BLOCK_SIZE = 4096  # 每次向量化计算的输出点数（限制长音频的临时内存）
+    
+    def __init__(self, input_rate: int, output_rate: int):
+        divisor = math.gcd(input_rate, output_rate)
+        self.up = output_rate // divisor
+        self.down = input_rate // divisor
+        
+        # 原型低通滤波器（以上采样后的采样率设计），长度为 up 的整数倍，按相位拆分
+        factor = max(self.up, self.down)
+        self.taps = int(math.ceil(2 * self.ZERO_CROSSINGS * factor / self.ROLLOFF / self.up))
+        length = self.taps * self.up
+        cutoff = self.ROLLOFF / (2 * factor)
+        n = np.arange(length) - (length - 1) / 2
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, self.KAISER_BETA) * self.up
+        # phases[p, j]：第 p 相与按时间顺序排列的 taps 个输入点对应的系数
+        self.phases = np.ascontiguousarray(prototype.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32)
+        self.reset()
+    
+    def reset(self):
+        """开始新的音频流"""
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        # 已接收的输入点数和下一个输出点的序号
+        self._consumed = 0
+        self._next_output = 0
+    
+    def process(self, audio: np.ndarray) -> np.ndarray:
+        """重采样一帧 float32 音频，返回本帧可以确定的所有输出点"""
+        buffer = np.concatenate((self._history, audio.astype(np.float32, copy=False)))
+        total = self._consumed + len(audio)
+        
+        # 输出点 k 所需的最后一个输入点 (k*M)//L 须已收到
+        end = -(-total * self.up // self.down)
+        positions = np.arange(self._next_output, end, dtype=np.int64) * self.down
+        # 每个输出点的输入窗口在 buffer 中的起点和所用的滤波器相位
+        starts = positions // self.up - self._consumed
+        phases = positions % self.up
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)
+        output = np.empty(len(positions), dtype=np.float32)
+        for block in range(0, len(positions), self.BLOCK_SIZE):
+            index = slice(block, block + self.BLOCK_SIZE)
+            output[index] = np.einsum("ij,ij->i", windows[starts[index]], self.phases[phases[index]])
+        
+        self._history = buffer[len(buffer) - (self.taps - 1):].copy()
+        self._consumed = total
+        self._next_output = end
+        return output
+
+
+class AudioConverter:
+    """
+    客户端音频格式转换 - 将客户端在 start 指令中声明的格式转换为模型所需的 16kHz 单声道音频
+    
+    int16/float32 为交织的多声道原始采样，转换时先混为单声道再流式重采样；
+    opus 每个音频帧为一个 Opus 数据包，解码器直接输出 16kHz 单声道（需安装 opuslib）。
+    声明格式与模型格式相同（16kHz 单声道 int16）时原样透传 PCM16 字节，由 AudioProcessor 一步转换写入缓冲区；
+    其余格式输出 float32 数组，直接写入缓冲区，不再经过 int16 量化。
+    """
+    
+    FORMATS = ("int16", "float32", "opus")
+    OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+    MIN_SAMPLE_RATE = 8000
+    MAX_SAMPLE_RATE = 96000
+    MAX_CHANNELS = 8
+    
+    def __init__(self, sample_rate: int = 16000, channels: int = 1, sample_format: str = "int16"):
+        if sample_format not in self.FORMATS:
+            raise ValueError(f"不支持的音频格式: {sample_format}（可选 {'/'.join(self.FORMATS)}）")
+        if not self.MIN_SAMPLE_RATE <= sample_rate <= self.MAX_SAMPLE_RATE:
+            raise ValueError(f"不支持的采样率: {sample_rate}Hz（{self.MIN_SAMPLE_RATE}-{self.MAX_SAMPLE_RATE}Hz）")
+        if not 1 <= channels <= self.MAX_CHANNELS:
+            raise ValueError(f"不支持的声道数: {channels}（1-{self.MAX_CHANNELS}）")
+        
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self.passthrough = sample_format == "int16" and channels == 1 and sample_rate == config.SAMPLE_RATE
+        self._resampler: Optional[StreamingResampler] = None
+        self._decoder = None
+        
+        if sample_format == "opus":
+            if sample_rate not in self.OPUS_SAMPLE_RATES or channels > 2:
+                raise ValueError(f"Opus 仅支持 {self.OPUS_SAMPLE_RATES}Hz 采样率和 1-2 个声道")
+            try:
+                import opuslib
+            except Exception:
+                # 未安装 opuslib，或找不到 libopus 动态库（opuslib 导入时抛出普通 Exception）
+                raise ValueError("服务端未安装 opuslib/libopus，不支持 opus 格式")
+            self._opus = opuslib
+            # 单个数据包最长 120ms
+            self._max_frame_size = config.SAMPLE_RATE * 120 // 1000
+        elif sample_rate != config.SAMPLE_RATE:
+            self._resampler = StreamingResampler(sample_rate, config.SAMPLE_RATE)
+        self.reset()
+    
+    @property
+    def description(self) -> str:
+        return f"{self.sample_format}/{self.sample_rate}Hz/{self.channels}ch"
+    
+    def reset(self):
+        """开始新的话语：清空重采样历史和解码器状态"""
+        if self._resampler is not None:
+            self._resampler.reset()
+        if self.sample_format == "opus":
+            # 解码器以模型采样率、单声道输出（libopus 内部完成重采样和混音）
+            self._decoder = self._opus.Decoder(config.SAMPLE_RATE, 1)
+    
+    def convert(self, data: bytes) -> Union[bytes, np.ndarray]:
+        """
+        转换一帧客户端音频
+        
+        Returns:
+            透传时为原始 PCM16 字节，否则为 16kHz 单声道 float32 数组
+            
+        Raises:
+            ValueError: 数据与声明的格式不符
+        """
+        if self.passthrough:
+            return data
+        
+        if self._decoder is not None:
+            try:
+                pcm = self._decoder.decode_float(data, self._max_frame_size)
+            except self._opus.OpusError as e:
+                raise ValueError(f"Opus 解码失败: {e}")
+            return np.frombuffer(pcm, dtype=np.float32)
+        
+        dtype = np.int16 if self.sample_format == "int16" else np.float32
+        frame_bytes = np.dtype(dtype).itemsize * self.channels
+        if len(data) % frame_bytes:
+            raise ValueError(f"音频帧长度 {len(data)} 不是完整采样（{frame_bytes} 字节）的整数倍")
+        
+        samples = np.frombuffer(data, dtype=dtype)
+        if dtype is np.int16:
+            audio = samples * AudioProcessor.PCM16_SCALE
+        else:
+            audio = samples
+        if self.channels > 1:
+            audio = audio.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        if self._resampler is not None:
+            audio = self._resampler.process(audio)
+        return audio.astype(np.float32, copy=False)
+
+
+# ==================== 语音活动检测 ====================
+def frame_samples(frame: Union[bytes, np.ndarray]) -> np.ndarray:
+    """音频帧的采样数组：PCM16 字节按 int16 引用（不复制），float32 数组原样返回"""
+    if isinstance(frame, bytes):
+        return np.frombuffer(frame, dtype=np.int16)
+    return frame
+
+
+def frame_length(frame: Union[bytes, np.ndarray]) -> int:
+    """音频帧的采样点数"""
+    return len(frame) // 2 if isinstance(frame, bytes) else len(frame)
+
+
+class VoiceActivityDetector:
+    """
+    语音活动检测 - 基于能量和过零率的轻量级静音门限
+    
+    在推理之前丢弃按键前后的静音帧：语音结束后保留一段拖尾（hangover），
+    语音开始前保留最近的若干静音帧作为前导（pre-roll），避免切掉字头字尾。
+    """
+    
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        # 能量门限（dBFS，相对 int16 满幅）
+        self.energy_threshold_db = config.VAD_ENERGY_THRESHOLD_DB
+        self.zcr_threshold = config.VAD_ZCR_THRESHOLD
+        self.hangover_samples = int(config.VAD_HANGOVER_MS * sample_rate / 1000)
+        self.preroll_samples = int(config.VAD_PREROLL_MS * sample_rate / 1000)
+        
+        # 暂存的前导静音帧（PCM16 字节或 float32 数组，不复制）
+        self._preroll: deque = deque()
+        self._preroll_len = 0
+        # 距上一个语音帧的静音采样点数
+        self._silence_run = self.hangover_samples + 1
+        
+        self.skipped_frames = 0
+        self.skipped_samples = 0
+    
+    def reset(self):
+        """开始新的话语：清空前导帧，拖尾计时归零"""
+        self._drop_preroll(len(self._preroll))
+        self._silence_run = self.hangover_samples + 1
+    
+    def is_speech(self, pcm: np.ndarray) -> bool:
+        """
+        判断一帧音频（int16 或 [-1, 1] 的 float32）是否包含语音
+        
+        能量高于门限即判为语音；能量略低但过零率高的帧（清辅音等）也判为语音。
+        """
+        if len(pcm) == 0:
+            return False
+        
+        # einsum 按块转换类型计算平方和，不分配整帧的临时数组
+        energy = np.einsum("i,i->", pcm, pcm, dtype=np.float64) / len(pcm)
+        full_scale = 32768.0 if pcm.dtype == np.int16 else 1.0
+        energy_db = 10 * np.log10(energy / (full_scale ** 2) + 1e-12)
+        if energy_db >= self.energy_threshold_db:
+            return True
+        if energy_db < self.energy_threshold_db - 10:
+            return False
+        
+        zcr = np.count_nonzero(np.diff(np.signbit(pcm))) / len(pcm)
+        return zcr >= self.zcr_threshold
+    
+    def process(self, frame: Union[bytes, np.ndarray]) -> list:
+        """
+        对一帧音频做静音门限
+        
+        Args:
+            frame: PCM16 字节或 float32 数组（AudioConverter 的输出）
+            
+        Returns:
+            需要送入识别的帧列表（语音开始时包含前导帧），静音帧被丢弃时为空列表
+        """
+        try:
+            pcm = frame_samples(frame)
+        except ValueError:
+            # 无法解析的帧交给后续解码环节报错
+            return [frame]
+        
+        if self.is_speech(pcm):
+            frames = list(self._preroll) + [frame]
+            self._preroll.clear()
+            self._preroll_len = 0
+            self._silence_run = 0
+            return frames
+        
+        # 语音结束后的拖尾静音照常送入识别
+        self._silence_run += len(pcm)
+        if self._silence_run <= self.hangover_samples:
+            return [frame]
+        
+        # 其余静音帧暂存为前导，超出前导时长的最早帧被丢弃
+        self._preroll.append(frame)
+        self._preroll_len += len(pcm)
+        while self._preroll and self._preroll_len - frame_length(self._preroll[0]) >= self.preroll_samples:
+            self._drop_preroll(1)
+        return []
+    
+    def _drop_preroll(self, count: int):
+        for _ in range(count):
+            length = frame_length(self._preroll.popleft())
+            self._preroll_len -= length
+            self.skipped_frames += 1
+            self.skipped_samples += length
+
+
+class EndpointDetector:
+    """
+    尾点检测 - 按住按钮期间，语音之后的连续静音超过 ENDPOINT_SILENCE_MS 时判定话语已结束
+    
+    语音/静音判断与静音门限相同（能量和过零率）；每段静音只触发一次，重新出现语音后才能再次触发。
+    """
+    
+    def __init__(self, sample_rate: int = 16000):
+        self.silence_samples = int(config.ENDPOINT_SILENCE_MS * sample_rate / 1000)
+        self._classifier = VoiceActivityDetector(sample_rate)
+        self.reset()
+    
+    def reset(self):
+        """开始新的话语"""
+        self._heard_speech = False
+        self._silence_run = 0
+        # 尾点在音频流中的位置（累计采样点数），出现新的语音后清空
+        self.position: Optional[int] = None
+    
+    def process(self, frame: Union[bytes, np.ndarray]) -> bool:
+        """
+        检测一帧音频（PCM16 字节或 float32 数组）
+        
+        Returns:
+            本帧是否触发尾点（触发后由调用方记录 position）
+        """
+        try:
+            pcm = frame_samples(frame)
+        except ValueError:
+            return False
+        
+        if self._classifier.is_speech(pcm):
+            self._heard_speech = True
+            self._silence_run = 0
+            self.position = None
+            return False
+        
+        if not self._heard_speech or self._silence_run >= self.silence_samples:
+            return False
+        self._silence_run += len(pcm)
+        return self._silence_run >= self.silence_samples
+
+
+# ==================== 流式识别状态 ====================
+class StreamingRecognizer:
+    """
+    流式识别状态 - 保存单个连接的 paraformer-zh-streaming 模型缓存
+    
+    音频按固定块长（默认 600ms）送入模型，模型缓存保留跨块的上下文，
+    每块只计算新增部分；话语结束时以 is_final=True 刷新缓存得到最终结果。
+    
+    每次识别在模型缓存的副本上进行，完成后才写回缓存和文本；
+    识别期间状态被重置或识别被放弃（等待方超时）时丢弃结果，缓存与文本始终对应同一段已识别的音频。
+    """
+    
+    def __init__(self, sample_rate: int = 16000):
+        self.chunk_size = config.STREAMING_CHUNK_SIZE
+        # chunk_size[1] 为每块的帧数，每帧 60ms
+        self.chunk_stride = int(self.chunk_size[1] * 0.06 * sample_rate)
+        self.cache: dict = {}
+        self.text = ""
+        # 当前话语使用的热词表（start 时由会话设置）
+        self.hotwords: HotwordSet = hotword_registry.default
+        # 状态版本号：重置或放弃识别时递增，版本已变化的识别结果不再写回
+        self._generation = 0
+        self._lock = threading.Lock()
+    
+    def reset(self):
+        """重置模型缓存和已识别文本，开始新的话语"""
+        with self._lock:
+            self.cache = {}
+            self.text = ""
+            self._generation += 1
+    
+    def abandon(self):
+        """放弃正在执行的识别（等待方已超时或取消），其结果不再写回"""
+        with self._lock:
+            self._generation += 1
+    
+    def decode(self, audio: np.ndarray, is_final: bool = False) -> str:
+        """
+        识别一个音频块（在推理线程中执行）
+        
+        Args:
+            audio: float32 音频数据，通常为 chunk_stride 的整数倍（模型内部按块长切分）
+            is_final: 是否为话语的最后一块
+            
+        Returns:
+            本块新增的识别文本（识别已被放弃时为空）
+        """
+        with self._lock:
+            generation = self._generation
+            cache = copy.deepcopy(self.cache)
+        text = self._generate(audio, cache, is_final)
+        with self._lock:
+            if generation != self._generation:
+                return ""
+            self.cache = cache
+            self.text += text
+        return text
+    
+    def decode_speculative(self, audio: np.ndarray) -> str:
+        """
+        假定话语在此结束，在模型缓存的副本上以 is_final=True 识别尾部音频（在推理线程中执行）
+        
+        当前缓存和文本保持不变，之后仍可继续流式识别。
+        
+        Returns:
+            话语的完整最终文本
+        """
+        return self.text + self._generate(audio, copy.deepcopy(self.cache), True)
+    
+    def _generate(self, audio: np.ndarray, cache: dict, is_final: bool) -> str:
+        started = time.perf_counter()
+        result = model_generate(
+            asr_model,
+            input=audio,
+            cache=cache,
+            is_final=is_final,
+            chunk_size=self.chunk_size,
+            encoder_chunk_look_back=config.ENCODER_CHUNK_LOOK_BACK,
+            decoder_chunk_look_back=config.DECODER_CHUNK_LOOK_BACK,
+            disable_pbar=True,
+            **self.hotwords.generate_kwargs
+        )
+        decode_cost.record("first_pass", time.perf_counter() - started, len(audio))
+        return result[0].get("text", "") if result else ""
+
+
+# ==================== 两遍识别 ====================
+class DecodeCost:
+    """各遍识别的累计推理计算量（在推理线程中记录），用于对比流式识别与离线识别的开销"""
+    
+    PASSES = ("first_pass", "second_pass")
+    
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        # 各遍的 [调用次数, 计算耗时（秒）, 音频时长（采样点）]
+        self._totals = {name: [0, 0.0, 0] for name in self.PASSES}
+    
+    def record(self, name: str, seconds: float, num_samples: int):
+        DECODE_PASS_SECONDS.labels(name).observe(seconds)
+        with self._lock:
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += num_samples
+    
+    def get_stats(self) -> dict:
+        """各遍的调用次数、计算耗时、实时率和占总计算耗时的比例"""
+        with self._lock:
+            totals = {name: list(values) for name, values in self._totals.items()}
+        compute_total = sum(values[1] for values in totals.values())
+        stats = {}
+        for name, (calls, seconds, num_samples) in totals.items():
+            audio_seconds = num_samples / self.sample_rate
+            stats[name] = {
+                "calls": calls,
+                "compute_s": round(seconds, 3),
+                "audio_s": round(audio_seconds, 2),
+                "rtf": round(seconds / audio_seconds, 4) if audio_seconds else 0.0,
+                "share": round(seconds / compute_total, 4) if compute_total else 0.0
+            }
+        return stats
+
+
+decode_cost = DecodeCost(config.SAMPLE_RATE)
+
+
+def decode_second_pass(audio: np.ndarray, hotwords: HotwordSet) -> str:
+    """
+    第二遍：用离线模型识别整段话语（在推理线程中执行）
+    
+    流式模型只负责录音过程中的部分结果，较重的离线模型每段话语只运行一次，结果作为最终结果。
+    """
+    started = time.perf_counter()
+    result = model_generate(
+        offline_model,
+        input=audio,
+        batch_size=1,
+        disable_pbar=True,
+        **hotwords.generate_kwargs
+    )
+    decode_cost.record("second_pass", time.perf_counter() - started, len(audio))
+    return result[0].get("text", "") if result else ""
+
+
+def decode_segment(audio: np.ndarray, hotwords: HotwordSet) -> str:
+    """
+    离线转写：独立识别一个完整片段（在推理线程中执行）
+    
+    已加载离线模型时使用离线模型；否则用流式模型以全新缓存、is_final=True 一次性识别，
+    片段末尾不足一个块长的音频也会输出，且片段之间互不影响。
+    """
+    if offline_model is not None:
+        return decode_second_pass(audio, hotwords)
+    recognizer = StreamingRecognizer(config.SAMPLE_RATE)
+    recognizer.hotwords = hotwords
+    return recognizer.decode(audio, is_final=True)
+
+
+# ==================== 消息编码 ====================
+try:
+    import orjson
+except ImportError:  # 未安装时使用标准库 json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 未安装时不支持 ?encoding=msgpack
+    msgpack = None
+
+# 可协商的服务端消息编码：json 以文本帧发送，msgpack 以二进制帧发送
+MESSAGE_ENCODINGS = ("json", "msgpack")
+
+
+def encode_message(message: dict, encoding: str) -> Union[str, bytes]:
+    """按连接协商的编码序列化服务端消息（json 输出与 send_json 相同：紧凑分隔符、不转义非 ASCII 字符）"""
+    if encoding == "msgpack":
+        return msgpack.packb(message)
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_message(text: str) -> dict:
+    """解析客户端 JSON 文本帧"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+class StaticMessage:
+    """
+    内容固定的状态消息 - 除时间戳外的部分按各编码预先序列化，发送时只追加时间戳
+    
+    时间戳固定为最后一个字段：json 在去掉结尾 "}" 的前缀后拼接，
+    msgpack 在字段数加一的 map 头之后拼接 "timestamp" 键和值。
+    """
+    
+    def __init__(self, **fields):
+        self.fields = fields
+        body = encode_message(fields, "json")
+        self._json_prefix = body[:-1] + ',"timestamp":'
+        self._msgpack_prefix = None
+        if msgpack is not None:
+            # fixmap 头（最多 15 个字段）：0x80 | 字段数
+            packed = msgpack.packb(fields)
+            self._msgpack_prefix = bytes([0x80 | (len(fields) + 1)]) + packed[1:] + msgpack.packb("timestamp")
+    
+    def encode(self, encoding: str, timestamp: int) -> Union[str, bytes]:
+        if encoding == "msgpack":
+            return self._msgpack_prefix + msgpack.packb(timestamp)
+        return f"{self._json_prefix}{timestamp}}}"
+
+
+STATUS_STARTED = StaticMessage(type="status", code=200, message="开始录音")
+STATUS_ADMITTED = StaticMessage(type="status", code=200, message="开始录音", queue_position=0)
+STATUS_STOPPED = StaticMessage(type="status", code=200, message="停止录音")
+STATUS_RESET = StaticMessage(type="status", code=200, message="重置成功")
+
+
+# ==================== 部分结果 ====================
+# 可协商的部分结果格式：full 每次发送完整文本，delta 只发送与上一条部分结果不同的尾部
+RESULT_MODES = ("full", "delta")
+
+
+class PartialResultTracker:
+    """
+    部分结果跟踪 - 抑制未变化的部分结果、按增量发送、限制发送频率
+    
+    增量模式下消息携带 offset：客户端保留上一条结果的前 offset 个字符（Unicode 码点），再拼接本条的 text。
+    超过发送频率的部分结果暂缓发送，只保留最新的一条，间隔到期后再发送；最终结果始终为完整文本。
+    """
+    
+    def __init__(self, mode: str = "full", max_per_second: float = 0.0):
+        self.mode = mode
+        self.min_interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self.reset()
+    
+    def reset(self):
+        """开始新的话语（最终结果之后客户端从空文本开始）"""
+        # 客户端当前显示的部分结果
+        self.sent_text = ""
+        # 因频率限制暂缓发送的最新结果：(文本, 时间戳, 识别耗时)
+        self.pending: Optional[Tuple[str, int, float]] = None
+        self._last_sent = -math.inf
+    
+    def changed(self, text: str) -> bool:
+        """与最近一次发送（或暂缓发送）的结果相比是否有变化"""
+        latest = self.pending[0] if self.pending is not None else self.sent_text
+        return text != latest
+    
+    def delay(self) -> float:
+        """距离允许发送下一条部分结果还需等待的时间（秒）"""
+        return max(0.0, self._last_sent + self.min_interval - time.monotonic())
+    
+    def commit(self, text: str) -> Optional[int]:
+        """
+        记录即将发送的部分结果
+        
+        Returns:
+            增量模式下为与上一条结果的公共前缀长度，完整模式下为 None
+        """
+        offset = None
+        if self.mode == "delta":
+            offset = len(os.path.commonprefix((self.sent_text, text)))
+        self.sent_text = text
+        self.pending = None
+        self._last_sent = time.monotonic()
+        return offset
+
+
+# ==================== 识别会话 ====================
+class ASRSession:
+    """
+    识别会话 - 管理单个 WebSocket 连接的识别状态
+    
+    接收循环只负责解码音频并写入缓冲区，识别在后台任务中按顺序执行，
+    因此推理进行时控制指令和新的音频帧仍能被及时接收和处理。
+    """
+    
+    # 识别任务类型
+    JOB_AUDIO = "audio"
+    JOB_FINAL = "final"
+    JOB_ENDPOINT = "endpoint"
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        connection_id: int,
+        framing: str = "json",
+        encoding: str = "json",
+        result_mode: str = "full"
+    ):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        
+        # 音频帧格式：json（base64 编码，兼容模式）或 binary（原始 PCM16 二进制帧）
+        self.framing = framing
+        # 服务端消息编码：json（文本帧）或 msgpack（二进制帧）
+        self.encoding = encoding
+        
+        # 创建音频处理器
+        self.audio_processor = AudioProcessor(
+            sample_rate=config.SAMPLE_RATE,
+            max_seconds=config.MAX_UTTERANCE_SECONDS
+        )
+        
+        # 流式识别状态（关闭流式识别时每个音频帧独立识别）
+        self.streaming: Optional[StreamingRecognizer] = (
+            StreamingRecognizer(sample_rate=config.SAMPLE_RATE)
+            if config.STREAMING_ENABLED else None
+        )
+        
+        # 尾点检测（可选，仅流式识别）：按住按钮期间检测到话语结束时预先计算最终结果
+        self.endpoint: Optional[EndpointDetector] = (
+            EndpointDetector(sample_rate=config.SAMPLE_RATE)
+            if config.ENDPOINT_ENABLED and self.streaming is not None else None
+        )
+        # 正在后处理的最终结果发送任务（后处理与下一段话语的识别流水线执行）
+        self._final_delivery: Optional[asyncio.Task] = None
+        # 两遍识别（仅流式识别）：当前话语的起始位置，话语音频保留在缓冲区中，stop 后由离线模型识别
+        self.two_pass = bool(config.TWO_PASS_MODEL) and self.streaming is not None
+        self._utterance_start = 0
+        if self.two_pass:
+            self.audio_processor.pin(0)
+        # 预先计算的最终结果：(尾点位置, 文本, 识别耗时)
+        self._speculation: Optional[Tuple[int, str, float]] = None
+        # 各待处理最终识别对应的尾点位置（stop 时尾点之后没有新的语音才有效，否则为 None）
+        self._final_endpoints: deque = deque()
+        
+        # 部分结果：full（完整文本）或 delta（增量）
+        # 流式识别时按 PARTIAL_MAX_PER_SECOND 限制发送频率（非流式时各音频帧的结果相互独立，不能丢弃）
+        self.results = PartialResultTracker(
+            result_mode,
+            config.PARTIAL_MAX_PER_SECOND if self.streaming is not None else 0.0
+        )
+        
+        # 静音门限（可选）
+        self.vad: Optional[VoiceActivityDetector] = (
+            VoiceActivityDetector(sample_rate=config.SAMPLE_RATE)
+            if config.VAD_ENABLED else None
+        )
+        
+        # 客户端音频格式转换（默认 16kHz 单声道 int16，原样透传）
+        self.audio_converter = AudioConverter()
+        
+        # 热词表（start 指令中可按名称选择，之后的话语沿用）
+        self.hotwords: HotwordSet = hotword_registry.default
+        
+        # PTT 模式状态标志
+        self._is_recording = False
+        
+        # 统计信息
+        self.stats = {
+            "start_time": time.time(),
+            "audio_chunks": 0,
+            "audio_bytes": 0,
+            "recognitions": 0,
+            "errors": 0,
+            "coalesced_frames": 0,
+            "dropped_partials": 0,
+            "unchanged_partials": 0,
+            "throttled_partials": 0,
+            "backpressure_waits": 0,
+            "endpoints": 0,
+            "endpoint_hits": 0,
+            "max_lag_s": 0.0
+        }
+        
+        # 识别任务队列：(任务类型, 音频结束位置, 时间戳)，连续的音频任务入队时合并为一个
+        self._jobs: deque = deque()
+        self._job_ready = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        
+        # 背压：每个会话尚未识别的音频上限（流式识别时至少两个块长）
+        self.max_pending_samples = int(config.MAX_PENDING_AUDIO_SECONDS * config.SAMPLE_RATE)
+        if self.streaming is not None:
+            self.max_pending_samples = max(self.max_pending_samples, 2 * self.streaming.chunk_stride)
+        self._drained = asyncio.Event()
+        self._drained.set()
+        # 当前话语尚未发送过部分结果（首个部分结果按更高优先级推理）
+        self._awaiting_first_partial = False
+        
+        # 准入控制：是否持有录音名额；排队等待名额期间识别任务暂停，音频只写入缓冲区
+        self.holds_slot = False
+        self.queued_at: Optional[float] = None
+        self._slot_acquired_at = 0.0
+        self._admitted = asyncio.Event()
+        self._admitted.set()
+        # 已提交但尚未返回最终结果的话语数，全部完成后释放录音名额
+        self._pending_finals = 0
+    
+    @property
+    def is_recording(self) -> bool:
+        """是否正在录音（按钮按下）"""
+        return self._is_recording
+    
+    @is_recording.setter
+    def is_recording(self, value: bool):
+        if value and not self._is_recording:
+            RECORDING_SESSIONS.inc()
+        elif not value and self._is_recording:
+            RECORDING_SESSIONS.dec()
+        self._is_recording = value
+    
+    def start(self):
+        """启动后台识别任务"""
+        self._worker = asyncio.create_task(self._recognition_loop())
+    
+    async def close(self):
+        """停止后台识别任务，取消进行中的推理，释放录音名额"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._final_delivery is not None:
+            self._final_delivery.cancel()
+            self._final_delivery = None
+        self._drained.set()
+        admission_controller.release(self)
+    
+    async def reset(self):
+        """丢弃尚未识别的音频和流式状态，重新启动识别任务"""
+        await self.close()
+        self._jobs = deque()
+        self.results.reset()
+        self._pending_finals = 0
+        self._speculation = None
+        self._final_endpoints.clear()
+        self.queued_at = None
+        self._admitted.set()
+        self.audio_processor.clear_buffer()
+        self._start_next_utterance(self.audio_processor.samples_written)
+        self.audio_converter.reset()
+        if self.streaming is not None:
+            # 被取消的识别可能仍在推理线程中修改模型缓存
+            if inference_executor is not None:
+                await inference_executor.wait_abandoned(self.connection_id)
+            self.streaming.reset()
+        if self.vad is not None:
+            self.vad.reset()
+        if self.endpoint is not None:
+            self.endpoint.reset()
+        self.start()
+    
+    async def receive_audio(self, audio_data: Union[str, bytes, None], timestamp: int):
+        """
+        处理客户端发送的音频数据
+        
+        Args:
+            audio_data: 二进制音频数据，或 base64 编码的音频字符串（兼容模式），格式为 start 时声明的格式
+            timestamp: 音频时间戳（毫秒）
+        """
+        connection_id = self.connection_id
+        
+        # 只有在录音状态（按住按钮）时才处理音频
+        if not self.is_recording:
+            logger.debug("[%s] 收到音频数据但未在录音状态，忽略", connection_id)
+            return
+        
+        if not audio_data:
+            logger.warning("[%s] 收到空音频数据", connection_id)
+            return
+        
+        # 检查音频数据大小
+        if len(audio_data) > config.MAX_AUDIO_SIZE:
+            await self.send_error(413, "音频数据过大")
+            self.stats["errors"] += 1
+            return
+        
+        # 解码音频（二进制帧直接使用，base64 需先解码）
+        decode_start = time.perf_counter()
+        processor = self.audio_processor
+        if isinstance(audio_data, bytes):
+            audio_bytes = audio_data
+        else:
+            audio_bytes = processor.decode_audio(audio_data)
+        if not audio_bytes:
+            return
+        
+        # 转换为 16kHz 单声道（重采样、混音、解码 Opus）：透传时仍为 PCM16 字节，否则为 float32 数组
+        try:
+            audio_frame = self.audio_converter.convert(audio_bytes)
+        except ValueError as e:
+            logger.warning("[%s] 音频格式错误: %s", connection_id, e)
+            await self.send_error(400, f"音频格式错误: {e}")
+            self.stats["errors"] += 1
+            return
+        
+        self.stats["audio_chunks"] += 1
+        self.stats["audio_bytes"] += len(audio_data)
+        AUDIO_SECONDS_TOTAL.inc(frame_length(audio_frame) / config.SAMPLE_RATE)
+        
+        # 尾点检测在静音门限之前进行（静音门限会丢弃拖尾之后的静音帧）
+        endpointed = self.endpoint is not None and self.endpoint.process(audio_frame)
+        
+        # 静音门限：丢弃非语音帧，语音开始时补回前导帧
+        frames = [audio_frame] if self.vad is None else self.vad.process(audio_frame)
+        if not frames:
+            DECODE_SECONDS.observe(time.perf_counter() - decode_start)
+            if endpointed:
+                self._submit_endpoint(timestamp)
+            return
+        
+        # 转换并写入环形缓冲区，由后台任务调用 FunASR，接收循环不等待推理完成
+        dropped_before = processor.dropped_samples
+        for frame in frames:
+            processor.write(frame)
+        DECODE_SECONDS.observe(time.perf_counter() - decode_start)
+        if processor.dropped_samples > dropped_before:
+            logger.warning("[%s] 话语超过最大时长，丢弃音频", connection_id)
+            await self.send_error(413, f"话语超过最大时长（{config.MAX_UTTERANCE_SECONDS}s）")
+            self.stats["errors"] += 1
+        
+        self._enqueue(self.JOB_AUDIO, processor.samples_written, timestamp)
+        if endpointed:
+            self._submit_endpoint(timestamp)
+        
+        lag = self.lag_seconds
+        if lag > self.stats["max_lag_s"]:
+            self.stats["max_lag_s"] = lag
+        
+        # 背压：未识别音频超过上限时暂停接收，等待识别追上（后续数据留在 TCP 缓冲区，客户端发送随之变慢）
+        # 排队等待录音名额的会话尚未开始识别，不受此限制
+        if self._admitted.is_set() and processor.available >= self.max_pending_samples:
+            self.stats["backpressure_waits"] += 1
+            self._drained.clear()
+            await self._drained.wait()
     
-    logger.info("=" * 60)
-    logger.info("语音实时转录服务启动中...")
-    logger.info(f"部署模式: CPU")
-    logger.info(f"模型: {config.MODEL_NAME}")
-    logger.info(f"最大并发连接: {config.MAX_CONNECTIONS}")
-    logger.info("=" * 60)
+    @property
+    def lag_seconds(self) -> float:
+        """尚未识别的音频时长（秒）"""
+        return self.audio_processor.available / config.SAMPLE_RATE
     
-    # 设置 PyTorch 线程数优化 CPU 性能
-    config.setup_torch_threads()
-    logger.info(f"PyTorch 线程数设置为: {config.TORCH_NUM_THREADS}")
+    def _enqueue(self, job_type: str, end_position: int, timestamp: int):
+        """提交识别任务；连续的音频任务合并为一个，识别落后时一次处理所有积压音频"""
+        if job_type == self.JOB_AUDIO and self._jobs and self._jobs[-1][0] == self.JOB_AUDIO:
+            self._jobs[-1] = (job_type, end_position, timestamp)
+            self.stats["coalesced_frames"] += 1
+        else:
+            self._jobs.append((job_type, end_position, timestamp))
+        self._job_ready.set()
     
-    # 加载 FunASR 模型
-    logger.info("正在加载 FunASR 模型（CPU模式，常驻后台）...")
-    try:
-        asr_model = AutoModel(
-            model=config.MODEL_NAME,
-            model_revision=config.MODEL_REVISION,
-            device=config.DEVICE
-        )
-        logger.info("✓ FunASR 模型加载成功（CPU模式），已常驻后台，等待调用")
-    except Exception as e:
-        logger.error(f"✗ 模型加载失败: {e}")
-        raise
+    def _submit_endpoint(self, timestamp: int):
+        """检测到尾点：提交预先计算最终结果的任务"""
+        position = self.audio_processor.samples_written
+        self.endpoint.position = position
+        self.stats["endpoints"] += 1
+        self._enqueue(self.JOB_ENDPOINT, position, timestamp)
     
-    logger.info("=" * 60)
-    logger.info("服务启动完成，等待 WebSocket 连接...")
-    logger.info(f"WebSocket 端点: ws://{config.HOST}:{config.PORT}/ws/asr")
-    logger.info("=" * 60)
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """应用关闭时清理"""
-    logger.info("服务正在关闭...")
-    # 关闭所有 WebSocket 连接
-    for connection_id, websocket in list(connections.items()):
+    def configure_audio(self, message: dict):
+        """
+        按 start 指令声明的音频格式（sample_rate、channels、format）重建格式转换器，未声明的字段沿用当前格式
+        
+        Raises:
+            ValueError: 声明的格式不支持
+        """
+        if not any(key in message for key in ("sample_rate", "channels", "format")):
+            return
+        current = self.audio_converter
         try:
-            await websocket.close()
-            logger.info(f"关闭连接: {connection_id}")
-        except:
-            pass
-    connections.clear()
-    logger.info("服务已关闭")
-
-
-# ==================== 音频处理器 ====================
-class AudioProcessor:
-    """音频处理器 - 负责音频数据的解码和预处理"""
+            sample_rate = int(message.get("sample_rate", current.sample_rate))
+            channels = int(message.get("channels", current.channels))
+        except (TypeError, ValueError):
+            raise ValueError("sample_rate 和 channels 必须为整数")
+        self.audio_converter = AudioConverter(
+            sample_rate=sample_rate,
+            channels=channels,
+            sample_format=message.get("format", current.sample_format)
+        )
     
-    def __init__(self, sample_rate: int = 16000):
-        self.sample_rate = sample_rate
-        self.audio_buffer = []
+    def select_hotwords(self, name: Optional[str]):
+        """
+        按名称选择热词表（未指定时沿用当前热词表）
         
-    def decode_audio(self, audio_data: str) -> Optional[np.ndarray]:
+        Raises:
+            ValueError: 热词表不存在
+        """
+        if name is None:
+            return
+        try:
+            self.hotwords = hotword_registry.get(name)
+        except KeyError:
+            raise ValueError(f"未知的热词表: {name}")
+    
+    def begin_utterance(self):
+        """开始新的话语（按钮按下）"""
+        self.is_recording = True
+        self._awaiting_first_partial = True
+        self.audio_converter.reset()
+        # 上一段话语仍在识别时，热词表在其最终结果之后切换
+        if self.streaming is not None and self._pending_finals == 0:
+            self.streaming.hotwords = self.hotwords
+        if self.vad is not None:
+            self.vad.reset()
+        if self.endpoint is not None:
+            self.endpoint.reset()
+    
+    def admit(self):
+        """获得录音名额，开始识别"""
+        self.holds_slot = True
+        self.queued_at = None
+        self._slot_acquired_at = time.time()
+        self._admitted.set()
+    
+    def enqueue(self):
+        """进入准入等待队列，获得名额之前暂停识别"""
+        self.queued_at = time.time()
+        self._admitted.clear()
+    
+    def release_slot(self) -> float:
         """
-        解码 base64 音频数据为 numpy 数组
+        释放录音名额
         
-        Args:
-            audio_data: base64 编码的音频数据
-            
         Returns:
-            numpy 数组（float32）或 None（解码失败时）
+            占用名额的时长（秒）
         """
-        try:
-            # Base64 解码
-            audio_bytes = base64.b64decode(audio_data)
+        self.holds_slot = False
+        return time.time() - self._slot_acquired_at
+    
+    async def admission_timeout(self):
+        """排队超时：丢弃已缓冲的音频并通知客户端"""
+        logger.warning("[%s] 排队等待录音名额超时（>%ss）", self.connection_id, config.ADMISSION_TIMEOUT)
+        self.is_recording = False
+        self.stats["errors"] += 1
+        await self.reset()
+        await self.send_safely(self.send_error(503, "服务器繁忙，排队超时，请稍后重试"))
+    
+    def get_stats(self) -> dict:
+        """会话统计信息"""
+        stats = {
+            "connection_id": str(self.connection_id),
+            "framing": self.framing,
+            "encoding": self.encoding,
+            "result_mode": self.results.mode,
+            "audio_format": self.audio_converter.description,
+            "hotwords": self.hotwords.name,
+            "is_recording": self.is_recording,
+            "duration_s": round(time.time() - self.stats["start_time"], 2),
+            "audio_chunks": self.stats["audio_chunks"],
+            "recognitions": self.stats["recognitions"],
+            "errors": self.stats["errors"],
+            "lag_s": round(self.lag_seconds, 3),
+            "max_lag_s": round(self.stats["max_lag_s"], 3),
+            "coalesced_frames": self.stats["coalesced_frames"],
+            "dropped_partials": self.stats["dropped_partials"],
+            "unchanged_partials": self.stats["unchanged_partials"],
+            "throttled_partials": self.stats["throttled_partials"],
+            "backpressure_waits": self.stats["backpressure_waits"]
+        }
+        if self.endpoint is not None:
+            stats["endpoints"] = self.stats["endpoints"]
+            stats["endpoint_hits"] = self.stats["endpoint_hits"]
+        if self.queued_at is not None:
+            stats["queue_position"] = admission_controller.position(self)
+            stats["queued_s"] = round(time.time() - self.queued_at, 2)
+        if self.vad is not None:
+            stats["vad_skipped_frames"] = self.vad.skipped_frames
+            stats["vad_skipped_ms"] = round(self.vad.skipped_samples * 1000 / config.SAMPLE_RATE)
+        return stats
+    
+    def submit_final(self, timestamp: int):
+        """标记当前话语结束，识别任务处理完剩余音频后返回最终结果"""
+        self._pending_finals += 1
+        self._final_endpoints.append(self.endpoint.position if self.endpoint is not None else None)
+        self._enqueue(self.JOB_FINAL, self.audio_processor.samples_written, timestamp)
+        # 最终识别要等该连接排在前面的部分识别完成，部分识别随之按最终结果的优先级调度
+        if inference_executor is not None:
+            inference_executor.promote(self.connection_id, InferenceExecutor.PRIORITY_FINAL)
+    
+    async def send_message(self, message: dict):
+        """按协商的编码发送消息"""
+        await self._send_encoded(encode_message(message, self.encoding))
+    
+    async def send_static(self, message: StaticMessage):
+        """发送预先编码的固定状态消息"""
+        await self._send_encoded(message.encode(self.encoding, int(time.time() * 1000)))
+    
+    async def _send_encoded(self, data: Union[str, bytes]):
+        start = time.perf_counter()
+        if isinstance(data, bytes):
+            await self.websocket.send_bytes(data)
+        else:
+            await self.websocket.send_text(data)
+        SEND_SECONDS.observe(time.perf_counter() - start)
+    
+    async def send_error(self, code: int, message: str):
+        """发送错误消息"""
+        ERRORS_TOTAL.labels(code=str(code)).inc()
+        await self.send_message({
+            "type": "error",
+            "code": code,
+            "message": message,
+            "timestamp": int(time.time() * 1000)
+        })
+    
+    async def send_result(
+        self,
+        mode: str,
+        text: str,
+        timestamp: int,
+        recognition_time: float,
+        offset: Optional[int] = None,
+        stage_times: Optional[Dict[str, float]] = None
+    ):
+        """发送识别结果（指定 offset 时为增量结果，只发送 text[offset:]；stage_times 为最终结果各处理阶段的耗时）"""
+        RECOGNITIONS_TOTAL.labels(mode=mode).inc()
+        if config.RECOGNITION_LOG_FILE and random.random() < config.RECOGNITION_LOG_SAMPLE_RATE:
+            recognition_logger.info("recognition", extra={"fields": {
+                "connection_id": str(self.connection_id),
+                "mode": mode,
+                "text": text,
+                "timestamp": timestamp,
+                "processing_time_ms": round(recognition_time, 2),
+                "lag_s": round(self.lag_seconds, 3)
+            }})
+        message = {"type": "result", "mode": mode}
+        if offset is not None:
+            message["offset"] = offset
+            text = text[offset:]
+        message.update({
+            "text": text,
+            "timestamp": timestamp,
+            "confidence": 0.95,
+            "processing_time_ms": round(recognition_time, 2)
+        })
+        if stage_times is not None:
+            message["stage_times_ms"] = stage_times
+        await self.send_message(message)
+    
+    async def send_queue_status(self, position: int):
+        """发送排队位置和预计等待时间"""
+        await self.send_message({
+            "type": "status",
+            "code": 202,
+            "message": "排队等待识别资源",
+            "queue_position": position,
+            "estimated_wait_ms": admission_controller.estimated_wait_ms(position),
+            "timestamp": int(time.time() * 1000)
+        })
+    
+    async def _recognition_loop(self):
+        """后台识别循环：按接收顺序依次处理识别任务"""
+        connection_id = self.connection_id
+        while True:
+            await self._wait_for_job()
+            # 排队等待录音名额期间音频只写入缓冲区，获得名额后再依次识别
+            await self._admitted.wait()
+            job_type, end_position, timestamp = self._jobs.popleft()
+            SESSION_LAG_SECONDS.observe(self.lag_seconds)
+            try:
+                if job_type == self.JOB_FINAL:
+                    await self._finalize(end_position, timestamp)
+                elif job_type == self.JOB_ENDPOINT:
+                    await self._speculate(end_position, timestamp)
+                else:
+                    await self._recognize(end_position, timestamp)
+            
+            except InferenceQueueFull as e:
+                self.stats["errors"] += 1
+                logger.warning("[%s] %s，丢弃音频块", connection_id, e)
+                await self.send_safely(self.send_error(503, "服务器繁忙，识别队列已满"))
             
-            # 转换为 int16 数组
-            audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
+            except asyncio.TimeoutError:
+                self.stats["errors"] += 1
+                logger.error("[%s] 识别超时（>%ss）", connection_id, inference_executor.timeout)
+                await self.send_safely(self.send_error(504, "识别超时"))
             
-            # 转换为 float32 并归一化到 [-1, 1]
-            audio_float = audio_array.astype(np.float32) / 32768.0
+            except asyncio.CancelledError:
+                raise
+            
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error("[%s] 识别错误: %s", connection_id, e)
+                await self.send_safely(self.send_error(500, f"识别失败: {str(e)}"))
+            
+            # 唤醒因背压暂停的接收循环
+            self._drained.set()
+            
+            # 话语全部识别完毕且未开始新的录音时释放录音名额
+            if job_type == self.JOB_FINAL:
+                self._pending_finals -= 1
+                if not self.is_recording and self._pending_finals == 0:
+                    admission_controller.release(self)
+    
+    async def _wait_for_job(self):
+        """等待新的识别任务；发送间隔到期后先发送因频率限制暂缓的部分结果"""
+        while True:
+            # 已松开按钮时暂缓的部分结果会被最终结果取代，不再发送
+            pending = self.results.pending
+            if (
+                pending is not None
+                and not self._pending_finals
+                and not self._delivering_final
+                and self.results.delay() <= 0
+            ):
+                await self.send_safely(self._send_partial(*pending))
+            if self._jobs:
+                return
             
-            return audio_float
+            self._job_ready.clear()
+            # 上一段话语的最终结果发送后由其完成回调唤醒
+            if self.results.pending is None or self._delivering_final:
+                await self._job_ready.wait()
+                continue
+            waiter = asyncio.ensure_future(self._job_ready.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.results.delay())
+            finally:
+                waiter.cancel()
+    
+    async def send_safely(self, coro):
+        """发送消息并忽略发送失败（通常意味着连接已断开，由接收循环负责清理）"""
+        try:
+            await coro
         except Exception as e:
-            logger.error(f"音频解码失败: {e}")
-            return None
+            logger.debug("[%s] 发送失败: %s", self.connection_id, e)
     
-    def clear_buffer(self):
-        """清空音频缓冲区"""
-        self.audio_buffer = []
-        logger.debug("音频缓冲区已清空")
+    @property
+    def _delivering_final(self) -> bool:
+        """上一段话语的最终结果是否仍在后处理（尚未发送）"""
+        return self._final_delivery is not None and not self._final_delivery.done()
+    
+    @property
+    def _partial_priority(self) -> int:
+        """部分识别的推理优先级：新话语的首个部分结果优先于后续部分结果"""
+        if self._awaiting_first_partial:
+            return InferenceExecutor.PRIORITY_FIRST_PARTIAL
+        return InferenceExecutor.PRIORITY_PARTIAL
+    
+    async def _run_inference(self, func, *args, priority: int):
+        """
+        提交本连接的流式推理
+        
+        此前超时放弃的推理仍在线程中执行时先等待其结束：同一连接的推理不并发执行，
+        一个卡住的连接也不会占用多个推理线程。
+        """
+        await inference_executor.wait_abandoned(self.connection_id)
+        try:
+            return await inference_executor.run(func, *args, priority=priority, owner=self.connection_id)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # 已放弃的识别不再是当前任务，结果丢弃，下一块从放弃前的缓存继续
+            if self.streaming is not None:
+                self.streaming.abandon()
+            raise
+    
+    async def _recognize(self, end_position: int, timestamp: int):
+        """识别缓冲区中截至 end_position 的音频，返回部分结果"""
+        connection_id = self.connection_id
+        processor = self.audio_processor
+        
+        if self.streaming is None:
+            # 非流式：每个音频帧独立识别，提交到动态批处理器与其他会话合并推理
+            audio_chunk = processor.read(end_position - processor.samples_read)
+            if len(audio_chunk) == 0:
+                return
+            start_time = time.time()
+            logger.debug("[%s] 调用 FunASR 识别（音频长度: %s）...", connection_id, len(audio_chunk))
+            result = await inference_batcher.submit(
+                audio_chunk,
+                connection_id,
+                priority=self._partial_priority,
+                **self.hotwords.generate_kwargs
+            )
+            recognition_time = (time.time() - start_time) * 1000  # 毫秒
+            text = result.get("text", "") if result else ""
+            if not text.strip():
+                logger.debug("[%s] 识别结果为空", connection_id)
+                return
+            # 各音频帧的识别结果相互独立，不做变化抑制和频率限制
+            await self._send_partial(text, timestamp, recognition_time)
+            return
+        
+        # 已松开按钮时，剩余音频的部分结果会立即被最终结果取代：留给最终识别一次处理
+        if config.DROP_STALE_PARTIALS and self._pending_finals:
+            return
+        
+        # 流式：凑满固定块长后送入模型，不足一块的音频留在缓冲区等待后续数据
+        # 识别落后时将积压的多个块合并为一次调用（模型内部按块长切分），减少调用开销
+        stride = self.streaming.chunk_stride
+        while end_position - processor.samples_read >= stride:
+            strides = min((end_position - processor.samples_read) // stride, config.STREAMING_MAX_COALESCE)
+            audio_chunk = processor.read(strides * stride)
+            start_time = time.time()
+            logger.debug("[%s] 调用 FunASR 流式识别（音频长度: %s，%s 块）...", connection_id, len(audio_chunk), strides)
+            await self._run_inference(
+                self.streaming.decode,
+                audio_chunk,
+                False,
+                priority=self._partial_priority
+            )
+            recognition_time = (time.time() - start_time) * 1000  # 毫秒
+            
+            text = self.streaming.text
+            if not self.results.changed(text):
+                logger.debug("[%s] 识别结果无变化", connection_id)
+                self.stats["unchanged_partials"] += 1
+                continue
+            # 仍有积压的音频时，这条部分结果很快会被更新的结果取代，不再发送
+            if config.DROP_STALE_PARTIALS and processor.available >= stride:
+                self.stats["dropped_partials"] += 1
+                continue
+            await self._emit_partial(text, timestamp, recognition_time)
+    
+    async def _emit_partial(self, text: str, timestamp: int, recognition_time: float):
+        if not text.strip():
+            logger.debug("[%s] 识别结果为空", self.connection_id)
+            return
+        if not self.results.changed(text):
+            logger.debug("[%s] 识别结果无变化", self.connection_id)
+            self.stats["unchanged_partials"] += 1
+            return
+        
+        # 频率限制：间隔未到时只保留最新的结果，由识别循环在间隔到期后发送
+        # 上一段话语的最终结果仍在后处理时同样暂缓，结果按话语顺序到达客户端，识别照常进行
+        if self.results.delay() > 0 or self._delivering_final:
+            if self.results.pending is not None:
+                self.stats["throttled_partials"] += 1
+            self.results.pending = (text, timestamp, recognition_time)
+            return
+        await self._send_partial(text, timestamp, recognition_time)
+    
+    async def _send_partial(self, text: str, timestamp: int, recognition_time: float):
+        offset = self.results.commit(text)
+        self.stats["recognitions"] += 1
+        self._awaiting_first_partial = False
+        await self.send_result("partial", text, timestamp, recognition_time, offset=offset)
+        logger.info("[%s] 识别结果: %s (耗时: %.2fms)", self.connection_id, text, recognition_time)
+    
+    def _end_utterance(self, end_position: int):
+        """清空流式状态，下一段话语使用新的热词表并从空文本开始（最终结果取代暂缓发送的部分结果）"""
+        self.streaming.reset()
+        self.streaming.hotwords = self.hotwords
+        self.results.reset()
+        self._start_next_utterance(end_position)
+    
+    def _start_next_utterance(self, position: int):
+        """下一段话语的音频从 position 开始（两遍识别时此前的音频不再保留）"""
+        self._utterance_start = position
+        if self.two_pass:
+            self.audio_processor.pin(position)
+    
+    async def _speculate(self, end_position: int, timestamp: int):
+        """尾点：识别截至尾点的音频，并在模型缓存的副本上预先计算最终结果"""
+        self._speculation = None
+        # 已收到 stop 时直接进行最终识别
+        if self._pending_finals:
+            return
+        
+        processor = self.audio_processor
+        if self.two_pass:
+            # 两遍识别：最终结果由离线模型识别截至尾点的整段话语
+            decode, args = decode_second_pass, (processor.copy(self._utterance_start, end_position), self.streaming.hotwords)
+        else:
+            await self._recognize(end_position, timestamp)
+            audio_chunk = processor.peek(end_position - processor.samples_read)
+            if len(audio_chunk) == 0 and not self.streaming.cache:
+                return
+            decode, args = self.streaming.decode_speculative, (audio_chunk,)
+        
+        start_time = time.time()
+        try:
+            text = await self._run_inference(
+                decode,
+                *args,
+                priority=InferenceExecutor.PRIORITY_FIRST_PARTIAL
+            )
+        except (InferenceQueueFull, asyncio.TimeoutError) as e:
+            # 预先计算失败不影响识别，stop 后照常进行最终识别
+            logger.debug("[%s] 尾点预先计算失败: %s", self.connection_id, e)
+            return
+        except Exception as e:
+            # 推理出错同样不向客户端报错，由 stop 后的最终识别决定结果
+            logger.warning("[%s] 尾点预先计算出错: %s", self.connection_id, e)
+            return
+        self._speculation = (end_position, text, (time.time() - start_time) * 1000)
+        logger.debug("[%s] 检测到尾点，预先计算最终结果: %s", self.connection_id, text)
+    
+    async def _finalize(self, end_position: int, timestamp: int):
+        """识别话语剩余音频并刷新模型缓存，返回最终结果"""
+        endpoint_position = self._final_endpoints.popleft() if self._final_endpoints else None
+        speculation, self._speculation = self._speculation, None
+        if self.streaming is None:
+            return
+        
+        connection_id = self.connection_id
+        processor = self.audio_processor
+        
+        if speculation is not None and speculation[0] == endpoint_position:
+            # 尾点之后没有新的语音：直接使用预先计算的最终结果，丢弃尾点之后的静音
+            processor.read(end_position - processor.samples_read)
+            _, text, recognition_time = speculation
+            self.stats["endpoint_hits"] += 1
+            self._end_utterance(end_position)
+        elif self.two_pass:
+            # 两遍识别：尚未进行流式识别的音频不再需要部分结果，整段话语由离线模型识别一次
+            processor.read(end_position - processor.samples_read)
+            start_time = time.time()
+            try:
+                text = await inference_executor.run(
+                    decode_second_pass,
+                    processor.copy(self._utterance_start, end_position),
+                    self.streaming.hotwords,
+                    priority=InferenceExecutor.PRIORITY_FINAL,
+                    owner=connection_id
+                )
+                recognition_time = (time.time() - start_time) * 1000  # 毫秒
+            finally:
+                self._end_utterance(end_position)
+        else:
+            # 先按固定块长识别完已凑满的音频，再将不足一块的尾部音频作为最后一块
+            # （DROP_STALE_PARTIALS 时不再产生部分结果，剩余音频全部作为最后一块）
+            await self._recognize(end_position, timestamp)
+            audio_chunk = processor.read(end_position - processor.samples_read)
+            
+            start_time = time.time()
+            try:
+                if len(audio_chunk) > 0 or self.streaming.cache:
+                    await self._run_inference(
+                        self.streaming.decode,
+                        audio_chunk,
+                        True,
+                        priority=InferenceExecutor.PRIORITY_FINAL
+                    )
+                recognition_time = (time.time() - start_time) * 1000  # 毫秒
+                text = self.streaming.text
+            finally:
+                self._end_utterance(end_position)
+        
+        self.stats["recognitions"] += 1
+        if postprocessor is not None and postprocessor.enabled:
+            # 后处理在独立线程池中进行，识别任务不等待，直接开始处理下一段话语的音频
+            self._final_delivery = asyncio.create_task(
+                self._deliver_final(self._final_delivery, text, timestamp, recognition_time)
+            )
+            # 最终结果发送后唤醒识别循环，发送期间暂缓的部分结果
+            self._final_delivery.add_done_callback(lambda _: self._job_ready.set())
+            return
+        await self.send_result("final", text, timestamp, recognition_time)
+        logger.info("[%s] 最终结果: %s (耗时: %.2fms)", connection_id, text, recognition_time)
+    
+    async def _deliver_final(
+        self,
+        previous: Optional[asyncio.Task],
+        text: str,
+        timestamp: int,
+        recognition_time: float
+    ):
+        """对最终结果做后处理，在上一条最终结果发送之后发送"""
+        stage_times = {"asr": round(recognition_time, 2)}
+        try:
+            text, timings = await postprocessor.run(text)
+            stage_times.update(timings)
+        except Exception as e:
+            logger.warning("[%s] 结果后处理失败，发送原始识别结果: %s", self.connection_id, e)
+        
+        if previous is not None:
+            await asyncio.wait({previous})
+        await self.send_safely(self.send_result("final", text, timestamp, recognition_time, stage_times=stage_times))
+        logger.info(
+            "[%s] 最终结果: %s (耗时: %s)",
+            self.connection_id, text, ", ".join(f"{stage} {ms:.2f}ms" for stage, ms in stage_times.items())
+        )
 
 
 # ==================== WebSocket 端点 ====================
@@ -158,231 +3318,483 @@ async def websocket_endpoint(websocket: WebSocket):
     协议说明:
     - 客户端发送: {"type": "control", "command": "start|stop|reset", "timestamp": ...}
     - 客户端发送: {"type": "audio", "data": "base64...", "timestamp": ...}
-    - 服务端返回: {"type": "result|status|error", ...}
+    - 客户端发送: 二进制帧（原始 PCM16 音频，需以 ?framing=binary 连接）
+    - 服务端返回: {"type": "result|status|error", ...}（JSON 文本帧；以 ?encoding=msgpack 连接时为 msgpack 二进制帧）
+    - 识别结果: 录音过程中返回 "mode": "partial"，stop 后返回 "mode": "final"
+    - 增量结果: 以 ?results=delta 连接时部分结果携带 offset，text 为从第 offset 个字符开始的新尾部
     """
     
-    # 检查连接数限制
-    if len(connections) >= config.MAX_CONNECTIONS:
+    # 检查连接数限制（多进程模式下为所有工作进程的总数）
+    if not connection_limiter.try_acquire():
         await websocket.close(code=1008, reason="服务器连接已满，请稍后重试")
-        logger.warning(f"连接被拒绝：已达到最大连接数 {config.MAX_CONNECTIONS}")
+        REJECTED_CONNECTIONS_TOTAL.labels(reason="max_connections").inc()
+        logger.warning("连接被拒绝：已达到最大连接数 %s", config.MAX_CONNECTIONS)
+        return
+    
+    # 协商音频帧格式
+    framing = websocket.query_params.get("framing", "json")
+    if framing not in ("json", "binary"):
+        connection_limiter.release()
+        await websocket.close(code=1008, reason=f"不支持的音频帧格式: {framing}")
+        REJECTED_CONNECTIONS_TOTAL.labels(reason="bad_framing").inc()
+        logger.warning("连接被拒绝：不支持的音频帧格式 %s", framing)
+        return
+    
+    # 协商服务端消息编码
+    encoding = websocket.query_params.get("encoding", "json")
+    if encoding not in MESSAGE_ENCODINGS or (encoding == "msgpack" and msgpack is None):
+        connection_limiter.release()
+        await websocket.close(code=1008, reason=f"不支持的消息编码: {encoding}")
+        REJECTED_CONNECTIONS_TOTAL.labels(reason="bad_encoding").inc()
+        logger.warning("连接被拒绝：不支持的消息编码 %s", encoding)
+        return
+    
+    # 协商部分结果格式
+    result_mode = websocket.query_params.get("results", "full")
+    if result_mode not in RESULT_MODES:
+        connection_limiter.release()
+        await websocket.close(code=1008, reason=f"不支持的结果格式: {result_mode}")
+        REJECTED_CONNECTIONS_TOTAL.labels(reason="bad_results").inc()
+        logger.warning("连接被拒绝：不支持的结果格式 %s", result_mode)
         return
     
     # 接受 WebSocket 连接
-    await websocket.accept()
+    try:
+        await websocket.accept()
+    except Exception:
+        connection_limiter.release()
+        raise
     
     # 生成唯一连接 ID
     connection_id = id(websocket)
     connections[connection_id] = websocket
     
-    # 创建音频处理器
-    audio_processor = AudioProcessor(sample_rate=config.SAMPLE_RATE)
-    
-    # PTT 模式状态标志
-    is_recording = False
+    # 创建识别会话
+    session = ASRSession(websocket, connection_id, framing=framing, encoding=encoding, result_mode=result_mode)
+    stats = session.stats
+    sessions[connection_id] = session
+    ACTIVE_SESSIONS.inc()
     
-    # 统计信息
-    stats = {
-        "start_time": time.time(),
-        "audio_chunks": 0,
-        "recognitions": 0,
-        "errors": 0
-    }
-    
-    logger.info(f"新连接建立: {connection_id} | 当前连接数: {len(connections)}")
+    logger.info(
+        "新连接建立: %s | 音频帧格式: %s | 消息编码: %s | 结果格式: %s | 当前连接数: %s",
+        connection_id, framing, encoding, result_mode, len(connections)
+    )
     
     # 发送连接成功消息
     try:
-        await websocket.send_json({
+        await session.send_message({
             "type": "status",
             "code": 200,
             "message": "连接成功，FunASR已就绪",
             "connection_id": str(connection_id),
+            "framing": framing,
+            "encoding": encoding,
+            "results": result_mode,
             "timestamp": int(time.time() * 1000)
         })
     except Exception as e:
-        logger.error(f"[{connection_id}] 发送连接确认失败: {e}")
+        logger.error("[%s] 发送连接确认失败: %s", connection_id, e)
+        del connections[connection_id]
+        del sessions[connection_id]
+        ACTIVE_SESSIONS.dec()
+        connection_limiter.release()
         return
     
+    session.start()
+    
     try:
         while True:
-            # 接收客户端消息
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # 接收客户端消息（文本帧为 JSON 消息，二进制帧为 PCM16 音频）
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            
+            # ==================== 处理二进制音频帧 ====================
+            if frame.get("bytes") is not None:
+                if session.framing != "binary":
+                    logger.warning("[%s] 收到未协商的二进制帧", connection_id)
+                    await session.send_error(400, "未协商二进制音频帧，请使用 ?framing=binary 连接")
+                    stats["errors"] += 1
+                    continue
+                await session.receive_audio(frame["bytes"], int(time.time() * 1000))
+                continue
+            
+            message = decode_message(frame["text"])
             
             msg_type = message.get("type")
             timestamp = message.get("timestamp", int(time.time() * 1000))
             
             # ==================== 处理音频数据 ====================
             if msg_type == "audio":
-                # 只有在录音状态（按住按钮）时才处理音频
-                if not is_recording:
-                    logger.debug(f"[{connection_id}] 收到音频数据但未在录音状态，忽略")
-                    continue
-                
-                audio_data = message.get("data")
-                
-                if not audio_data:
-                    logger.warning(f"[{connection_id}] 收到空音频数据")
-                    continue
-                
-                # 检查音频数据大小
-                if len(audio_data) > config.MAX_AUDIO_SIZE:
-                    await websocket.send_json({
-                        "type": "error",
-                        "code": 413,
-                        "message": "音频数据过大",
-                        "timestamp": int(time.time() * 1000)
-                    })
-                    stats["errors"] += 1
-                    continue
-                
-                # 解码音频
-                audio_chunk = audio_processor.decode_audio(audio_data)
-                
-                if audio_chunk is not None and len(audio_chunk) > 0:
-                    stats["audio_chunks"] += 1
-                    
-                    # 调用 FunASR 进行识别
-                    try:
-                        start_time = time.time()
-                        logger.debug(f"[{connection_id}] 调用 FunASR 识别（音频长度: {len(audio_chunk)}）...")
-                        
-                        # 调用模型进行识别
-                        result = asr_model.generate(
-                            input=audio_chunk,
-                            batch_size=1,
-                            disable_pbar=True,
-                            hotwords=config.HOTWORDS
-                        )
-                        
-                        recognition_time = (time.time() - start_time) * 1000  # 毫秒
-                        
-                        if result and len(result) > 0:
-                            text = result[0].get("text", "")
-                            
-                            if text.strip():
-                                stats["recognitions"] += 1
-                                
-                                # 返回识别结果
-                                await websocket.send_json({
-                                    "type": "result",
-                                    "mode": "partial",
-                                    "text": text,
-                                    "timestamp": timestamp,
-                                    "confidence": 0.95,
-                                    "processing_time_ms": round(recognition_time, 2)
-                                })
-                                
-                                logger.info(
-                                    f"[{connection_id}] 识别结果: {text} "
-                                    f"(耗时: {recognition_time:.2f}ms)"
-                                )
-                            else:
-                                logger.debug(f"[{connection_id}] 识别结果为空")
-                        else:
-                            logger.debug(f"[{connection_id}] 未获取到识别结果")
-                            
-                    except Exception as e:
-                        stats["errors"] += 1
-                        logger.error(f"[{connection_id}] 识别错误: {e}")
-                        await websocket.send_json({
-                            "type": "error",
-                            "code": 500,
-                            "message": f"识别失败: {str(e)}",
-                            "timestamp": int(time.time() * 1000)
-                        })
+                # 兼容模式：base64 编码的音频
+                await session.receive_audio(message.get("data"), timestamp)
             
             # ==================== 处理控制指令 ====================
             elif msg_type == "control":
                 command = message.get("command")
                 
                 if command == "start":
-                    # 用户按下按钮，开始录音
-                    is_recording = True
-                    audio_processor.clear_buffer()
-                    logger.info(f"[{connection_id}] ▶ 开始录音（按钮按下）")
+                    if model_status != "ready":
+                        await session.send_error(503, "模型加载中，请稍后重试")
+                        stats["errors"] += 1
+                        continue
+                    
+                    # 客户端声明的音频格式（采样率、声道数、采样格式）和热词表
+                    try:
+                        session.configure_audio(message)
+                        session.select_hotwords(message.get("hotwords"))
+                    except ValueError as e:
+                        await session.send_error(400, str(e))
+                        stats["errors"] += 1
+                        continue
                     
-                    await websocket.send_json({
-                        "type": "status",
-                        "code": 200,
-                        "message": "开始录音",
-                        "timestamp": int(time.time() * 1000)
-                    })
+                    # 用户按下按钮，申请录音名额（名额已满时排队，排队期间音频照常缓冲）
+                    position = admission_controller.request(session)
+                    if position is None:
+                        logger.warning("[%s] 录音排队已满，拒绝录音请求", connection_id)
+                        await session.send_error(503, "服务器繁忙，排队已满，请稍后重试")
+                        stats["errors"] += 1
+                        continue
+                    
+                    # 上一段话语若仍在识别，其音频已按位置标记，不清空缓冲区
+                    session.begin_utterance()
+                    if position:
+                        logger.info("[%s] ▶ 开始录音（按钮按下），排队等待识别资源，位置: %s", connection_id, position)
+                        await session.send_queue_status(position)
+                        continue
+                    logger.info("[%s] ▶ 开始录音（按钮按下）", connection_id)
+                    
+                    await session.send_static(STATUS_STARTED)
                 
                 elif command == "stop":
-                    # 用户松开按钮，停止录音
-                    is_recording = False
-                    logger.info(f"[{connection_id}] ⏸ 停止录音（按钮松开），FunASR回到空闲")
+                    # 用户松开按钮，停止录音，剩余音频识别完毕后返回最终结果
+                    session.is_recording = False
+                    session.submit_final(timestamp)
+                    logger.info("[%s] ⏸ 停止录音（按钮松开），FunASR回到空闲", connection_id)
                     
-                    await websocket.send_json({
-                        "type": "status",
-                        "code": 200,
-                        "message": "停止录音",
-                        "timestamp": int(time.time() * 1000)
-                    })
+                    await session.send_static(STATUS_STOPPED)
                 
                 elif command == "reset":
                     # 重置状态
-                    is_recording = False
-                    audio_processor.clear_buffer()
-                    logger.info(f"[{connection_id}] 🔄 重置状态")
+                    session.is_recording = False
+                    await session.reset()
+                    logger.info("[%s] 🔄 重置状态", connection_id)
                     
-                    await websocket.send_json({
-                        "type": "status",
-                        "code": 200,
-                        "message": "重置成功",
-                        "timestamp": int(time.time() * 1000)
-                    })
+                    await session.send_static(STATUS_RESET)
                 
                 else:
-                    logger.warning(f"[{connection_id}] 未知控制指令: {command}")
-                    await websocket.send_json({
-                        "type": "error",
-                        "code": 400,
-                        "message": f"未知控制指令: {command}",
-                        "timestamp": int(time.time() * 1000)
-                    })
+                    logger.warning("[%s] 未知控制指令: %s", connection_id, command)
+                    await session.send_error(400, f"未知控制指令: {command}")
             
             # ==================== 处理未知消息类型 ====================
             else:
-                logger.warning(f"[{connection_id}] 未知消息类型: {msg_type}")
-                await websocket.send_json({
-                    "type": "error",
-                    "code": 400,
-                    "message": f"未知消息类型: {msg_type}",
-                    "timestamp": int(time.time() * 1000)
-                })
+                logger.warning("[%s] 未知消息类型: %s", connection_id, msg_type)
+                await session.send_error(400, f"未知消息类型: {msg_type}")
     
     except WebSocketDisconnect:
         # 连接正常断开
         duration = time.time() - stats["start_time"]
+        vad_info = f"静音跳过: {session.vad.skipped_frames} 帧 | " if session.vad else ""
         logger.info(
-            f"连接断开: {connection_id} | "
-            f"持续时间: {duration:.2f}s | "
-            f"音频块: {stats['audio_chunks']} | "
-            f"识别次数: {stats['recognitions']} | "
-            f"错误: {stats['errors']}"
+            "连接断开: %s | 持续时间: %.2fs | 音频块: %s (%s 字节) | 识别次数: %s | %s错误: %s",
+            connection_id, duration, stats["audio_chunks"], stats["audio_bytes"],
+            stats["recognitions"], vad_info, stats["errors"]
         )
         
     except Exception as e:
         # 异常错误
         stats["errors"] += 1
-        logger.error(f"[{connection_id}] WebSocket 错误: {e}", exc_info=True)
+        logger.error("[%s] WebSocket 错误: %s", connection_id, e, exc_info=True)
         try:
-            await websocket.send_json({
-                "type": "error",
-                "code": 500,
-                "message": f"服务器错误: {str(e)}",
-                "timestamp": int(time.time() * 1000)
-            })
+            await session.send_error(500, f"服务器错误: {str(e)}")
         except:
             pass
     
     finally:
+        # 停止后台识别并取消进行中的推理
+        session.is_recording = False
+        await session.close()
         # 清理连接
         if connection_id in connections:
             del connections[connection_id]
-        logger.info(f"连接清理完成: {connection_id} | 剩余连接数: {len(connections)}")
+        sessions.pop(connection_id, None)
+        ACTIVE_SESSIONS.dec()
+        connection_limiter.release()
+        logger.info("连接清理完成: %s | 剩余连接数: %s", connection_id, len(connections))
+
+
+# ==================== 离线转写 ====================
+def split_on_silence(audio: np.ndarray, sample_rate: int) -> List[Tuple[int, int]]:
+    """
+    按静音切分长音频（基于帧能量）
+    
+    Args:
+        audio: float32 音频数据（[-1, 1]）
+        sample_rate: 采样率
+        
+    Returns:
+        语音片段列表 [(起始采样点, 结束采样点), ...]
+    """
+    frame = int(0.03 * sample_rate)
+    num_frames = len(audio) // frame
+    if num_frames == 0:
+        return [(0, len(audio))] if len(audio) else []
+    
+    frames = audio[:num_frames * frame].reshape(num_frames, frame)
+    energy = np.einsum("ij,ij->i", frames, frames) / frame
+    speech = 10 * np.log10(energy + 1e-12) >= config.VAD_ENERGY_THRESHOLD_DB
+    
+    idx = np.flatnonzero(speech)
+    if len(idx) == 0:
+        return []
+    
+    # 合并间隔短于最小静音时长的语音段
+    min_gap = max(1, config.OFFLINE_MIN_SILENCE_MS // 30)
+    breaks = np.flatnonzero(np.diff(idx) > min_gap)
+    starts = np.r_[idx[0], idx[breaks + 1]]
+    ends = np.r_[idx[breaks], idx[-1]] + 1
+    
+    # 两端各保留 200ms，避免切掉字头字尾
+    pad = int(0.2 * sample_rate)
+    return [
+        (max(0, int(start) * frame - pad), min(len(audio), int(end) * frame + pad))
+        for start, end in zip(starts, ends)
+    ]
+
+
+def limit_segment_length(segments: List[Tuple[int, int]], sample_rate: int) -> List[Tuple[int, int]]:
+    """将超过最大时长的片段等分为多段"""
+    max_len = int(config.OFFLINE_MAX_SEGMENT_SECONDS * sample_rate)
+    result = []
+    for start, end in segments:
+        if end <= start:
+            continue
+        pieces = max(1, -(-(end - start) // max_len))
+        step = -(-(end - start) // pieces)
+        result.extend((s, min(s + step, end)) for s in range(start, end, step))
+    return result
+
+
+def load_audio_file(data: bytes, content_type: str) -> np.ndarray:
+    """
+    解析上传的音频文件
+    
+    WAV/FLAC 等容器格式通过 soundfile 读取；其余数据按原始 PCM16 处理，
+    采样率和声道数可在 Content-Type 参数中声明（如 audio/l16; rate=8000; channels=2，默认 16kHz 单声道）。
+    多声道取平均，非 16kHz 的音频重采样到 16kHz。
+    
+    Returns:
+        float32 单声道音频
+        
+    Raises:
+        ValueError: 音频格式不支持
+    """
+    media_type, *params = [part.strip() for part in content_type.split(";")]
+    is_raw = media_type in ("audio/pcm", "audio/l16", "application/octet-stream")
+    if is_raw and not data.startswith(b"RIFF"):
+        if len(data) % 2:
+            raise ValueError("PCM16 数据长度必须为偶数")
+        options = dict(param.split("=", 1) for param in params if "=" in param)
+        try:
+            converter = AudioConverter(
+                sample_rate=int(options.get("rate", config.SAMPLE_RATE)),
+                channels=int(options.get("channels", 1))
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"不支持的 PCM 参数: {e}")
+        audio = converter.convert(data)
+        if isinstance(audio, bytes):
+            return np.frombuffer(audio, dtype=np.int16) * AudioProcessor.PCM16_SCALE
+        return audio
+    
+    import soundfile
+    
+    try:
+        audio, sample_rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    except Exception as e:
+        raise ValueError(f"无法解析音频文件: {e}")
+    
+    audio = audio.mean(axis=1, dtype=np.float32) if audio.shape[1] > 1 else audio[:, 0]
+    if sample_rate != config.SAMPLE_RATE:
+        audio = StreamingResampler(sample_rate, config.SAMPLE_RATE).process(audio)
+    return audio
+
+
+async def segment_audio(audio: np.ndarray) -> List[Tuple[int, int]]:
+    """在 VAD 边界处切分音频：已加载 fsmn-vad 模型时使用模型，否则使用帧能量"""
+    sample_rate = config.SAMPLE_RATE
+    if vad_model is None:
+        segments = split_on_silence(audio, sample_rate)
+    else:
+        result = await inference_executor.run(model_generate, vad_model, input=audio, disable_pbar=True)
+        segments = [
+            (int(beg * sample_rate / 1000), int(end * sample_rate / 1000))
+            for beg, end in (result[0].get("value", []) if result else [])
+        ]
+    return limit_segment_length(segments, sample_rate)
+
+
+async def transcribe_segments(
+    audio: np.ndarray,
+    segments: List[Tuple[int, int]],
+    request_id: int,
+    hotwords: HotwordSet
+):
+    """
+    并行识别所有片段，按时间顺序逐个产出结果
+    
+    每个片段作为独立话语识别（见 decode_segment），由多个推理线程并行执行；
+    同时在途的片段数受限，避免长音频占满推理队列。
+    """
+    sample_rate = config.SAMPLE_RATE
+    limit = asyncio.Semaphore(2 * config.INFERENCE_WORKERS)
+    
+    async def recognize(start: int, end: int) -> dict:
+        async with limit:
+            text = await inference_executor.run(
+                decode_segment,
+                audio[start:end],
+                hotwords,
+                priority=InferenceExecutor.PRIORITY_OFFLINE,
+                owner=request_id
+            )
+        # 后处理在独立线程池中进行，不占用并发名额，后续片段的识别照常进行
+        try:
+            text, _ = await postprocessor.run(text)
+        except Exception as e:
+            logger.warning("[transcribe:%s] 结果后处理失败，返回原始识别结果: %s", request_id, e)
+        return {
+            "start_ms": round(start * 1000 / sample_rate),
+            "end_ms": round(end * 1000 / sample_rate),
+            "text": text
+        }
+    
+    tasks = [asyncio.create_task(recognize(start, end)) for start, end in segments]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def transcribe_error(status_code: int, detail: str) -> HTTPException:
+    """构造离线转写错误响应并计入错误指标"""
+    ERRORS_TOTAL.labels(code=str(status_code)).inc()
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+def transcribe_failure(e: Exception) -> Tuple[int, str]:
+    """识别异常对应的状态码和错误信息（与 WebSocket 接口一致：队列已满 503，超时 504，其他 500）"""
+    if isinstance(e, InferenceQueueFull):
+        return 503, "服务器繁忙，识别队列已满"
+    if isinstance(e, asyncio.TimeoutError):
+        return 504, "识别超时"
+    return 500, f"识别失败: {str(e)}"
+
+
+async def read_request_body(request: Request, limit: int) -> bytes:
+    """
+    按块读取请求体，超过 limit 字节时立即返回 413，不等待上传完成
+    
+    Content-Length 已声明超限时不读取请求体直接拒绝。
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise transcribe_error(413, "音频文件过大")
+    
+    buffer = bytearray()
+    async for chunk in request.stream():
+        buffer.extend(chunk)
+        if len(buffer) > limit:
+            raise transcribe_error(413, "音频文件过大")
+    return bytes(buffer)
+
+
+@app.post("/v1/transcribe")
+async def transcribe(request: Request, stream: bool = False, hotwords: Optional[str] = None):
+    """
+    离线转写接口
+    
+    支持 multipart 文件上传（字段名 file）或直接在请求体中发送音频（可分块传输）。
+    长音频在静音处切分后并行识别，返回带时间戳的片段；
+    stream=true 或 Accept: application/x-ndjson 时以 NDJSON 逐段返回；hotwords 为热词表名称。
+    """
+    if model_status != "ready":
+        raise transcribe_error(503, "模型加载中，请稍后重试")
+    try:
+        hotword_set = hotword_registry.get(hotwords)
+    except KeyError:
+        raise transcribe_error(400, f"未知的热词表: {hotwords}")
+    
+    start_time = time.time()
+    request_id = id(request)
+    content_type = request.headers.get("content-type", "")
+    
+    # 读取音频数据（边接收边检查大小，超限立即拒绝）
+    if content_type.startswith("multipart/form-data"):
+        # multipart 请求体比文件本身多出分隔符和字段头，额外留出 64KB
+        body = await read_request_body(request, config.MAX_TRANSCRIBE_SIZE + 64 * 1024)
+        
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        
+        form = await Request(request.scope, receive).form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise transcribe_error(400, "缺少音频文件（字段名 file）")
+        data = await upload.read()
+        content_type = upload.content_type or ""
+    else:
+        data = await read_request_body(request, config.MAX_TRANSCRIBE_SIZE)
+    
+    if not data:
+        raise transcribe_error(400, "音频数据为空")
+    if len(data) > config.MAX_TRANSCRIBE_SIZE:
+        raise transcribe_error(413, "音频文件过大")
+    
+    try:
+        audio = await asyncio.get_running_loop().run_in_executor(None, load_audio_file, data, content_type)
+    except ValueError as e:
+        raise transcribe_error(400, str(e))
+    
+    try:
+        segments = await segment_audio(audio)
+    except Exception as e:
+        logger.error("[transcribe:%s] VAD 切分错误: %s", request_id, e)
+        raise transcribe_error(*transcribe_failure(e))
+    duration_ms = round(len(audio) * 1000 / config.SAMPLE_RATE)
+    logger.info("[transcribe:%s] 音频时长: %sms | 片段数: %s", request_id, duration_ms, len(segments))
+    
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        async def ndjson():
+            try:
+                async for segment in transcribe_segments(audio, segments, request_id, hotword_set):
+                    yield json.dumps(segment, ensure_ascii=False) + "\n"
+            except Exception as e:
+                # 响应头已发送，错误以最后一行返回
+                logger.error("[transcribe:%s] 识别错误: %s", request_id, e)
+                status_code, detail = transcribe_failure(e)
+                ERRORS_TOTAL.labels(code=str(status_code)).inc()
+                yield json.dumps({"error": detail, "code": status_code}, ensure_ascii=False) + "\n"
+        
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    
+    try:
+        results = [segment async for segment in transcribe_segments(audio, segments, request_id, hotword_set)]
+    except Exception as e:
+        logger.error("[transcribe:%s] 识别错误: %s", request_id, e)
+        raise transcribe_error(*transcribe_failure(e))
+    
+    processing_time = (time.time() - start_time) * 1000
+    logger.info("[transcribe:%s] 转写完成 (耗时: %.2fms)", request_id, processing_time)
+    
+    return {
+        "text": "".join(segment["text"] for segment in results),
+        "segments": results,
+        "duration_ms": duration_ms,
+        "processing_time_ms": round(processing_time, 2)
+    }
 
 
 # ==================== HTTP 端点 ====================
@@ -393,7 +3805,8 @@ async def root():
         "service": "语音实时转录接口",
         "version": "2.1.0",
         "mode": "PTT (Push-to-Talk)",
-        "model": config.MODEL_NAME,
+        "model": loaded_model or configured_model(),
+        "backend": config.ASR_BACKEND,
         "device": config.DEVICE,
         "endpoint": f"ws://{config.HOST}:{config.PORT}/ws/asr",
         "status": "running"
@@ -402,21 +3815,46 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
-    import psutil
-    
-    cpu_percent = psutil.cpu_percent(interval=0.1)
-    memory = psutil.virtual_memory()
+    """健康检查接口（系统状态为后台采样的缓存结果）"""
+    ready, reason = readiness()
     
     return {
         "status": "healthy",
+        "ready": ready,
+        "not_ready_reason": reason,
         "model_loaded": asr_model is not None,
+        "model_status": model_status,
         "active_connections": len(connections),
+        "total_connections": connection_limiter.total,
         "max_connections": config.MAX_CONNECTIONS,
-        "cpu_usage_percent": cpu_percent,
-        "memory_usage_percent": memory.percent,
+        "recording_sessions": recording_limiter.total,
+        "waiting_sessions": admission_controller.waiting,
+        **system_sampler.snapshot,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/health/live")
+async def liveness_check():
+    """存活检查：进程和事件循环能够响应即为存活；模型加载失败时返回 503，由编排系统重启"""
+    if model_status == "failed":
+        return JSONResponse(
+            {"status": "model_failed", "timestamp": datetime.now().isoformat()},
+            status_code=503
+        )
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """就绪检查：模型未就绪（加载、预热中）或推理队列已满时返回 503，负载均衡应暂停转发新连接"""
+    ready, reason = readiness()
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "reason": reason,
         "timestamp": datetime.now().isoformat()
     }
+    return JSONResponse(body, status_code=200 if ready else 503)
 
 
 @app.get("/stats")
@@ -424,13 +3862,83 @@ async def get_stats():
     """获取服务统计信息"""
     return {
         "active_connections": len(connections),
+        "total_connections": connection_limiter.total,
         "max_connections": config.MAX_CONNECTIONS,
-        "model": config.MODEL_NAME,
+        "workers": config.WORKERS,
+        "worker_pid": os.getpid(),
+        "model": loaded_model or configured_model(),
+        "backend": config.ASR_BACKEND,
         "device": config.DEVICE,
-        "sample_rate": config.SAMPLE_RATE
+        "sample_rate": config.SAMPLE_RATE,
+        "cpu_time_s": round(time.process_time(), 3),
+        "system": system_sampler.snapshot,
+        "event_loop": loop_monitor.get_stats(),
+        "hotword_sets": hotword_registry.get_stats(),
+        "inference": {
+            "workers": config.INFERENCE_WORKERS,
+            "max_queue_size": config.INFERENCE_QUEUE_SIZE,
+            "timeout_s": config.INFERENCE_TIMEOUT,
+            "pending": inference_executor.pending if inference_executor else 0,
+            "queue_depth": inference_executor.queue_depth if inference_executor else 0,
+            **(inference_executor.stats if inference_executor else {}),
+            "priorities": inference_executor.get_priority_stats() if inference_executor else {}
+        },
+        "batching": inference_batcher.get_stats() if inference_batcher else {},
+        "postprocess": postprocessor.get_stats() if postprocessor else {},
+        "two_pass": {
+            "model": config.TWO_PASS_MODEL or None,
+            "enabled": offline_model is not None,
+            **decode_cost.get_stats()
+        },
+        "admission": admission_controller.get_stats(),
+        "vad_enabled": config.VAD_ENABLED,
+        "sessions": [session.get_stats() for session in sessions.values()]
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 监控指标（多进程模式下汇总所有工作进程）"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10):
+    """
+    采样分析当前工作进程，返回折叠栈文本（flamegraph.pl / speedscope 可直接读取）
+    
+    需配置 DEBUG_PROFILE_TOKEN 开启，请求头携带 Authorization: Bearer <token>。
+    多进程模式下只分析处理本请求的工作进程。
+    """
+    if not config.DEBUG_PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization.lower().startswith("bearer ") else ""
+    if not hmac.compare_digest(token.encode(), config.DEBUG_PROFILE_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="未授权")
+    
+    if not 0 < seconds <= config.DEBUG_PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds 须在 (0, {config.DEBUG_PROFILE_MAX_SECONDS}] 范围内")
+    if sampling_profiler.running:
+        raise HTTPException(status_code=409, detail="已有采样在进行中")
+    
+    logger.info("开始采样分析（%ss）", seconds)
+    loop = asyncio.get_running_loop()
+    try:
+        collapsed = await loop.run_in_executor(None, sampling_profiler.profile, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return PlainTextResponse(collapsed, headers={
+        "Content-Disposition": f'attachment; filename="profile-{os.getpid()}-{int(time.time())}.folded"'
+    })
+
+
 @app.get("/test")
 async def test_page():
     """测试页面 - 提供简单的 WebSocket 测试界面"""
@@ -0,0 +1,318 @@
+"""
+压测与延迟基准工具
+模拟多个并发 PTT 会话回放 WAV 文件，统计首个部分结果延迟、松开按钮后最终结果延迟、
+实时率（RTF）和服务端处理耗时，以 JSON 输出吞吐量和分位数
+
+用法:
+    # 对已运行的服务压测
+    python benchmark.py --url ws://localhost:9999/ws/asr --sessions 20 --wav sample.wav
+
+    # 使用桩模型（无需下载模型），在子进程中启动服务后压测
+    python benchmark.py --stub-latency-ms 80 --sessions 20 --speed 2
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import sys
+import time
+import urllib.request
+from typing import List, Optional
+
+import numpy as np
+import websockets
+
+SAMPLE_RATE = 16000
+
+
+# ==================== 桩模型 ====================
+class StubModel:
+    """
+    桩模型 - 模拟 FunASR AutoModel.generate 的接口和耗时
+
+    每次调用耗时 = 固定延迟 + 音频时长 × rtf，返回与音频时长成比例的伪文本。
+    """
+
+    def __init__(self, latency_ms: float, rtf: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.rtf = rtf
+
+    def _decode(self, audio) -> dict:
+        seconds = len(audio) / SAMPLE_RATE
+        time.sleep(self.latency + seconds * self.rtf)
+        return {"key": "stub", "text": "字" * max(0, int(seconds * 4))}
+
+    def generate(self, input=None, cache=None, is_final=False, **kwargs):
+        if isinstance(input, list):
+            # 批量推理：一次调用的固定开销只计一次
+            time.sleep(self.latency)
+            return [{"key": f"stub{i}", "text": "字" * int(len(x) / SAMPLE_RATE * 4)} for i, x in enumerate(input)]
+        return [self._decode(input if input is not None else [])]
+
+
+def serve_stub(host: str, port: int, latency_ms: float, rtf: float):
+    """子进程入口：加载桩模型并启动服务"""
+    import uvicorn
+    import app as asr_app
+
+    asr_app.asr_model = StubModel(latency_ms, rtf)
+    uvicorn.run(asr_app.app, host=host, port=port, log_level="warning")
+
+
+def wait_for_server(http_url: str, timeout: float = 60.0):
+    """等待服务就绪（模型加载和预热完成前 /health/ready 返回 503）"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"{http_url}/health/ready", timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"服务在 {timeout}s 内未就绪: {http_url}")
+
+
+def fetch_stats(http_url: str) -> Optional[dict]:
+    """读取服务端统计信息"""
+    try:
+        with urllib.request.urlopen(f"{http_url}/stats", timeout=5) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None
+
+
+# ==================== 音频加载 ====================
+def load_wav(path: str) -> np.ndarray:
+    """读取 WAV 文件为 16kHz 单声道 int16"""
+    import soundfile
+
+    audio, sample_rate = soundfile.read(path, dtype="int16", always_2d=True)
+    if sample_rate != SAMPLE_RATE:
+        raise ValueError(f"{path}: 仅支持 {SAMPLE_RATE}Hz 音频（当前 {sample_rate}Hz）")
+    return audio.mean(axis=1).astype(np.int16) if audio.shape[1] > 1 else audio[:, 0]
+
+
+def synthetic_audio(seconds: float) -> np.ndarray:
+    """生成合成音频（调幅正弦波 + 噪声），未指定 WAV 文件时使用"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)
+    signal = 0.3 * envelope * np.sin(2 * np.pi * 220 * t) + 0.01 * np.random.randn(len(t))
+    return (signal * 32767).astype(np.int16)
+
+
+# ==================== 会话模拟 ====================
+async def run_utterance(websocket, audio: np.ndarray, args) -> dict:
+    """
+    回放一段话语：start → 按节奏发送音频 → stop → 等待最终结果
+
+    Returns:
+        本段话语的延迟统计
+    """
+    frame_samples = SAMPLE_RATE * args.frame_ms // 1000
+    frame_interval = args.frame_ms / 1000.0 / args.speed if args.speed > 0 else 0.0
+
+    record = {
+        "audio_seconds": len(audio) / SAMPLE_RATE,
+        "first_partial_s": None,
+        "final_s": None,
+        "total_s": None,
+        "server_processing_ms": 0.0,
+        "partials": 0,
+        "errors": 0
+    }
+    final_received = asyncio.Event()
+    state = {"first_audio": None, "stop": None}
+
+    async def receiver():
+        async for raw in websocket:
+            message = json.loads(raw)
+            now = time.perf_counter()
+            if message.get("type") == "error":
+                record["errors"] += 1
+            elif message.get("type") == "result":
+                record["server_processing_ms"] += message.get("processing_time_ms", 0.0)
+                if message.get("mode") == "final":
+                    record["final_s"] = now - state["stop"] if state["stop"] else None
+                    record["total_s"] = now - state["first_audio"] if state["first_audio"] else None
+                    final_received.set()
+                    return
+                record["partials"] += 1
+                if record["first_partial_s"] is None and state["first_audio"]:
+                    record["first_partial_s"] = now - state["first_audio"]
+
+    await websocket.send(json.dumps({"type": "control", "command": "start", "timestamp": int(time.time() * 1000)}))
+    receive_task = asyncio.create_task(receiver())
+
+    start = time.perf_counter()
+    for i, offset in enumerate(range(0, len(audio), frame_samples)):
+        frame = audio[offset:offset + frame_samples].tobytes()
+        if args.framing == "binary":
+            await websocket.send(frame)
+        else:
+            await websocket.send(json.dumps({
+                "type": "audio",
+                "data": base64.b64encode(frame).decode(),
+                "timestamp": int(time.time() * 1000)
+            }))
+        if state["first_audio"] is None:
+            state["first_audio"] = time.perf_counter()
+        # 按绝对时间对齐发送节奏，避免累计误差
+        delay = start + (i + 1) * frame_interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    state["stop"] = time.perf_counter()
+    await websocket.send(json.dumps({"type": "control", "command": "stop", "timestamp": int(time.time() * 1000)}))
+
+    try:
+        await asyncio.wait_for(final_received.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        record["errors"] += 1
+    finally:
+        receive_task.cancel()
+
+    record["rtf"] = record["server_processing_ms"] / 1000.0 / record["audio_seconds"] if record["audio_seconds"] else None
+    return record
+
+
+async def run_session(index: int, clips: List[np.ndarray], args) -> List[dict]:
+    """单个会话：依次回放若干段话语"""
+    url = args.url if args.framing == "json" else f"{args.url}?framing=binary"
+    records = []
+    try:
+        async with websockets.connect(url, max_size=None) as websocket:
+            await websocket.recv()
+            for n in range(args.utterances):
+                clip = clips[(index + n) % len(clips)]
+                records.append(await run_utterance(websocket, clip, args))
+                if args.pause_ms:
+                    await asyncio.sleep(args.pause_ms / 1000.0)
+    except Exception as e:
+        records.append({"connection_error": str(e)})
+    return records
+
+
+# ==================== 统计 ====================
+def percentiles(values: List[float]) -> Optional[dict]:
+    """计算分位数（毫秒）"""
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    data = np.array(values) * 1000
+    return {
+        "count": len(values),
+        "mean": round(float(data.mean()), 2),
+        "p50": round(float(np.percentile(data, 50)), 2),
+        "p90": round(float(np.percentile(data, 90)), 2),
+        "p95": round(float(np.percentile(data, 95)), 2),
+        "p99": round(float(np.percentile(data, 99)), 2),
+        "max": round(float(data.max()), 2)
+    }
+
+
+def summarize(records: List[dict], wall_seconds: float, args) -> dict:
+    """汇总所有话语的统计结果"""
+    utterances = [r for r in records if "connection_error" not in r]
+    completed = [r for r in utterances if r["final_s"] is not None]
+    audio_seconds = sum(r["audio_seconds"] for r in completed)
+    rtf = [r["rtf"] for r in completed if r["rtf"] is not None]
+
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "utterances_per_session": args.utterances,
+            "framing": args.framing,
+            "frame_ms": args.frame_ms,
+            "speed": args.speed,
+            "stub_latency_ms": args.stub_latency_ms
+        },
+        "wall_seconds": round(wall_seconds, 3),
+        "utterances": len(utterances),
+        "completed": len(completed),
+        "connection_errors": len(records) - len(utterances),
+        "errors": sum(r["errors"] for r in utterances),
+        "throughput": {
+            "audio_seconds_per_second": round(audio_seconds / wall_seconds, 3) if wall_seconds else None,
+            "utterances_per_second": round(len(completed) / wall_seconds, 3) if wall_seconds else None
+        },
+        "time_to_first_partial_ms": percentiles([r["first_partial_s"] for r in completed]),
+        "time_to_final_ms": percentiles([r["final_s"] for r in completed]),
+        "utterance_total_ms": percentiles([r["total_s"] for r in completed]),
+        "rtf": {
+            "mean": round(float(np.mean(rtf)), 4),
+            "p95": round(float(np.percentile(rtf, 95)), 4)
+        } if rtf else None,
+        "server_processing_ms_per_utterance": percentiles(
+            [r["server_processing_ms"] / 1000.0 for r in completed]
+        )
+    }
+
+
+async def run_benchmark(args) -> dict:
+    clips = [load_wav(path) for path in args.wav] if args.wav else [synthetic_audio(args.seconds)]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_session(i, clips, args) for i in range(args.sessions)))
+    wall_seconds = time.perf_counter() - start
+
+    report = summarize([r for session in results for r in session], wall_seconds, args)
+    report["server_stats"] = fetch_stats(args.http_url)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="语音实时转录服务压测工具")
+    parser.add_argument("--url", default="ws://localhost:9999/ws/asr", help="WebSocket 地址")
+    parser.add_argument("--sessions", type=int, default=10, help="并发会话数")
+    parser.add_argument("--utterances", type=int, default=3, help="每个会话回放的话语数")
+    parser.add_argument("--wav", nargs="*", default=[], help="回放的 WAV 文件（16kHz），未指定时使用合成音频")
+    parser.add_argument("--seconds", type=float, default=3.0, help="合成音频时长（秒）")
+    parser.add_argument("--frame-ms", type=int, default=100, help="每帧音频时长（毫秒）")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，1 为实时，0 为不限速")
+    parser.add_argument("--pause-ms", type=int, default=500, help="两段话语之间的间隔（毫秒）")
+    parser.add_argument("--framing", choices=["json", "binary"], default="binary", help="音频帧格式")
+    parser.add_argument("--timeout", type=float, default=30.0, help="等待最终结果的超时（秒）")
+    parser.add_argument("--stub-latency-ms", type=float, default=None,
+                        help="使用桩模型在子进程中启动服务，每次推理的固定耗时（毫秒）")
+    parser.add_argument("--stub-rtf", type=float, default=0.0, help="桩模型每秒音频额外耗时（秒）")
+    parser.add_argument("--stub-port", type=int, default=19999, help="桩模型服务端口")
+    parser.add_argument("--output", help="将 JSON 报告写入文件")
+    args = parser.parse_args(argv)
+
+    if args.stub_latency_ms is not None:
+        args.url = f"ws://127.0.0.1:{args.stub_port}/ws/asr"
+    args.http_url = args.url.replace("ws://", "http://").replace("wss://", "https://").rsplit("/ws/", 1)[0]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    server = None
+    if args.stub_latency_ms is not None:
+        server = multiprocessing.Process(
+            target=serve_stub,
+            args=("127.0.0.1", args.stub_port, args.stub_latency_ms, args.stub_rtf),
+            daemon=True
+        )
+        server.start()
+        wait_for_server(args.http_url)
+
+    try:
+        report = asyncio.run(run_benchmark(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join(timeout=5)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return 0 if report["completed"] == report["utterances"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
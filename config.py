@@ -12,17 +12,82 @@ class Config:
     MODEL_NAME: str = os.getenv("MODEL_NAME", "paraformer-zh-streaming")
     MODEL_REVISION: str = os.getenv("MODEL_REVISION", "v2.0.4")
     DEVICE: str = os.getenv("DEVICE", "cpu")  # 使用 CPU
-    HOTWORDS: list = os.getenv("HOTWORDS", "").split(",")
+    # 默认热词表（逗号分隔），未在 start 指令中选择热词表的会话使用
+    HOTWORDS: list = [word.strip() for word in os.getenv("HOTWORDS", "").split(",") if word.strip()]
+    # 命名热词表文件（JSON：{"表名": ["热词", ...]}），各会话在 start 指令中按名称选择
+    HOTWORD_SETS_FILE: str = os.getenv("HOTWORD_SETS_FILE", "")
+    # 已下载的本地模型目录，设置后直接从该目录加载，不再按 MODEL_NAME 访问模型仓库解析和校验
+    MODEL_DIR: str = os.getenv("MODEL_DIR", "")
+    # 模型快照文件（torch.save 序列化的完整模型对象）：文件存在时直接反序列化，不存在时正常加载后写入，供下次启动使用
+    MODEL_SNAPSHOT: str = os.getenv("MODEL_SNAPSHOT", "")
+    MODEL_WARMUP: bool = os.getenv("MODEL_WARMUP", "true").lower() == "true"  # 加载后执行预热推理再标记就绪
+    # 后台加载模型：端口立即开放（存活检查可用），模型加载和预热完成前就绪检查返回 503
+    BACKGROUND_MODEL_LOAD: bool = os.getenv("BACKGROUND_MODEL_LOAD", "true").lower() == "true"
+    
+    # ==================== 推理后端配置 ====================
+    # torch：FunASR AutoModel（PyTorch 全精度）；onnx：funasr_onnx 导出模型，在 onnxruntime 中运行（可 int8 量化）
+    ASR_BACKEND: str = os.getenv("ASR_BACKEND", "torch").lower()
+    # ONNX 模型目录或 ModelScope 模型 ID（目录中没有 ONNX 文件时 funasr_onnx 会自动导出，导出需要安装 funasr 和 torch）
+    ONNX_MODEL_DIR: str = os.getenv("ONNX_MODEL_DIR", "damo/speech_paraformer-large_asr_nat-zh-cn-16k-common-vocab8404-online")
+    ONNX_QUANTIZE: bool = os.getenv("ONNX_QUANTIZE", "true").lower() == "true"  # 使用 int8 量化模型
+    ONNX_INTRA_OP_THREADS: int = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))  # 算子内并行线程数，0 表示与 PyTorch 线程数分配相同
+    ONNX_INTER_OP_THREADS: int = int(os.getenv("ONNX_INTER_OP_THREADS", 1))  # 算子间并行线程数
+    
+    # ==================== 流式识别配置 ====================
+    # 启用后每个连接保存模型缓存，按固定块长流式识别；关闭则每个音频帧独立识别
+    STREAMING_ENABLED: bool = os.getenv("STREAMING_ENABLED", "true").lower() == "true"
+    # [左看, 块长, 右看]，单位为 60ms 帧；默认块长 10 帧即 600ms
+    STREAMING_CHUNK_SIZE: list = [int(x) for x in os.getenv("STREAMING_CHUNK_SIZE", "0,10,5").split(",")]
+    ENCODER_CHUNK_LOOK_BACK: int = int(os.getenv("ENCODER_CHUNK_LOOK_BACK", 4))  # 编码器回看块数
+    DECODER_CHUNK_LOOK_BACK: int = int(os.getenv("DECODER_CHUNK_LOOK_BACK", 1))  # 解码器回看块数
+    # 两遍识别：流式模型只产生部分结果，stop 后由离线模型（如 paraformer-zh）对整段话语识别一次作为最终结果；为空时关闭
+    TWO_PASS_MODEL: str = os.getenv("TWO_PASS_MODEL", "")
+    TWO_PASS_MODEL_REVISION: str = os.getenv("TWO_PASS_MODEL_REVISION", "v2.0.4")
     
     # ==================== 音频配置 ====================
     SAMPLE_RATE: int = 16000
     AUDIO_FORMAT: str = "pcm"
     CHUNK_SIZE: int = 8192  # CPU 环境推荐较大的块大小
+    MAX_UTTERANCE_SECONDS: float = float(os.getenv("MAX_UTTERANCE_SECONDS", 60))  # 单段话语最大时长（秒），决定每个会话的音频缓冲区大小
+    
+    # ==================== 静音门限（VAD）配置 ====================
+    VAD_ENABLED: bool = os.getenv("VAD_ENABLED", "false").lower() == "true"  # 推理前丢弃静音帧
+    VAD_ENERGY_THRESHOLD_DB: float = float(os.getenv("VAD_ENERGY_THRESHOLD_DB", -40))  # 能量门限（dBFS）
+    VAD_ZCR_THRESHOLD: float = float(os.getenv("VAD_ZCR_THRESHOLD", 0.3))  # 低能量帧判为语音的过零率门限
+    VAD_HANGOVER_MS: int = int(os.getenv("VAD_HANGOVER_MS", 300))  # 语音结束后保留的拖尾时长
+    VAD_PREROLL_MS: int = int(os.getenv("VAD_PREROLL_MS", 200))  # 语音开始前保留的前导时长
+    # 尾点检测（流式识别）：按住按钮期间语音之后的静音超过该时长时预先计算最终结果，stop 后立即返回
+    ENDPOINT_ENABLED: bool = os.getenv("ENDPOINT_ENABLED", "false").lower() == "true"
+    ENDPOINT_SILENCE_MS: int = int(os.getenv("ENDPOINT_SILENCE_MS", 500))
+    VAD_MODEL: str = os.getenv("VAD_MODEL", "")  # 离线转写切分模型，如 fsmn-vad；为空时按帧能量切分
+    VAD_MODEL_REVISION: str = os.getenv("VAD_MODEL_REVISION", "v2.0.4")
+    
+    # ==================== 离线转写配置 ====================
+    MAX_TRANSCRIBE_SIZE: int = int(os.getenv("MAX_TRANSCRIBE_SIZE", 100 * 1024 * 1024))  # 上传音频最大字节数
+    OFFLINE_MAX_SEGMENT_SECONDS: float = float(os.getenv("OFFLINE_MAX_SEGMENT_SECONDS", 30))  # 单个片段最大时长
+    OFFLINE_MIN_SILENCE_MS: int = int(os.getenv("OFFLINE_MIN_SILENCE_MS", 500))  # 切分所需的最小静音时长
+    
+    # ==================== 结果后处理配置 ====================
+    # 最终结果（含离线转写片段）的标点恢复模型，如 ct-punc；为空时不加标点
+    PUNC_MODEL: str = os.getenv("PUNC_MODEL", "")
+    PUNC_MODEL_REVISION: str = os.getenv("PUNC_MODEL_REVISION", "v2.0.4")
+    # 逆文本正则化（如 "二零二四年" → "2024年"），需安装 fun_text_processing
+    ITN_ENABLED: bool = os.getenv("ITN_ENABLED", "false").lower() == "true"
+    POSTPROCESS_WORKERS: int = int(os.getenv("POSTPROCESS_WORKERS", 1))  # 后处理线程数（与推理线程池分开）
     
     # ==================== WebSocket 配置 ====================
     WS_TIMEOUT: int = int(os.getenv("WS_TIMEOUT", 300))  # 5分钟
     MAX_MESSAGE_SIZE: int = 10 * 1024 * 1024  # 10MB
-    MAX_CONNECTIONS: int = int(os.getenv("MAX_CONNECTIONS", 20))  # CPU 环境限制并发
+    MAX_CONNECTIONS: int = int(os.getenv("MAX_CONNECTIONS", 100))  # 最大连接数（空闲连接开销很小，推理负载由准入控制限制）
+    
+    # ==================== 健康检查配置 ====================
+    HEALTH_SAMPLE_INTERVAL: float = float(os.getenv("HEALTH_SAMPLE_INTERVAL", 2))  # 系统状态采样间隔（秒）
+    
+    # ==================== 运行时诊断配置 ====================
+    LOOP_LAG_PROBE_INTERVAL: float = float(os.getenv("LOOP_LAG_PROBE_INTERVAL", 0.5))  # 事件循环延迟探测间隔（秒）
+    SLOW_CALLBACK_MS: float = float(os.getenv("SLOW_CALLBACK_MS", 0))  # 事件循环阻塞超过该时长时记录其调用栈（0 表示关闭）
+    DEBUG_PROFILE_TOKEN: str = os.getenv("DEBUG_PROFILE_TOKEN", "")  # /debug/profile 访问令牌，为空时关闭该接口
+    DEBUG_PROFILE_MAX_SECONDS: int = int(os.getenv("DEBUG_PROFILE_MAX_SECONDS", 60))  # 单次采样最长时间（秒）
     
     # ==================== 安全配置 ====================
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
@@ -34,19 +99,74 @@ class Config:
     LOG_FILE: str = "logs/asr.log"
     LOG_MAX_BYTES: int = 10 * 1024 * 1024  # 10MB
     LOG_BACKUP_COUNT: int = 5
+    # 识别记录（JSON Lines，每条识别结果一行），为空时不记录
+    RECOGNITION_LOG_FILE: str = os.getenv("RECOGNITION_LOG_FILE", "")
+    RECOGNITION_LOG_SAMPLE_RATE: float = float(os.getenv("RECOGNITION_LOG_SAMPLE_RATE", 1.0))  # 采样比例（0-1）
     
     # ==================== PyTorch 线程配置（CPU 优化）====================
     TORCH_NUM_THREADS: int = int(os.getenv("TORCH_NUM_THREADS", 4))
     OMP_NUM_THREADS: int = int(os.getenv("OMP_NUM_THREADS", 4))
     MKL_NUM_THREADS: int = int(os.getenv("MKL_NUM_THREADS", 4))
     
+    # ==================== 多进程配置 ====================
+    # 工作进程数（通过 server.py 启动时生效），模型在父进程加载一次后由各工作进程共享
+    WORKERS: int = int(os.getenv("WORKERS", 1))
+    
+    # ==================== 推理执行器配置 ====================
+    # 每个进程的推理线程数，默认每 4 个 PyTorch 线程分配一个推理线程
+    INFERENCE_WORKERS: int = int(os.getenv("INFERENCE_WORKERS", max(1, TORCH_NUM_THREADS // WORKERS // 4)))
+    INFERENCE_QUEUE_SIZE: int = int(os.getenv("INFERENCE_QUEUE_SIZE", 64))  # 最大排队推理请求数
+    INFERENCE_TIMEOUT: float = float(os.getenv("INFERENCE_TIMEOUT", 10))  # 单次推理超时（秒）
+    # 推理优先级调度：按 提交时间 + 时间预算 的截止时间先后执行（毫秒）
+    INFERENCE_DEADLINE_FINAL_MS: float = float(os.getenv("INFERENCE_DEADLINE_FINAL_MS", 300))  # 最终结果
+    INFERENCE_DEADLINE_FIRST_PARTIAL_MS: float = float(os.getenv("INFERENCE_DEADLINE_FIRST_PARTIAL_MS", 800))  # 话语的首个部分结果
+    INFERENCE_DEADLINE_PARTIAL_MS: float = float(os.getenv("INFERENCE_DEADLINE_PARTIAL_MS", 2000))  # 后续部分结果
+    INFERENCE_DEADLINE_OFFLINE_MS: float = float(os.getenv("INFERENCE_DEADLINE_OFFLINE_MS", 10000))  # 离线转写
+    
+    # ==================== 动态批处理配置 ====================
+    BATCH_WINDOW_MS: float = float(os.getenv("BATCH_WINDOW_MS", 20))  # 批处理收集窗口（毫秒）
+    BATCH_MAX_SIZE: int = int(os.getenv("BATCH_MAX_SIZE", 8))  # 单批最大音频块数
+    
+    # ==================== 准入控制配置 ====================
+    # 同时录音的会话数上限（所有工作进程共享），已连接但未按下按钮的会话不占用名额
+    MAX_RECORDING_SESSIONS: int = int(os.getenv("MAX_RECORDING_SESSIONS", 20))
+    ADMISSION_QUEUE_SIZE: int = int(os.getenv("ADMISSION_QUEUE_SIZE", 50))  # 每个进程最多排队等待录音的会话数
+    ADMISSION_TIMEOUT: float = float(os.getenv("ADMISSION_TIMEOUT", 30))  # 最长排队时间（秒）
+    # 负载保护：推理排队数或近期推理 p95 延迟超过门限时，新的录音请求进入排队（0 表示不检查）
+    SHED_QUEUE_DEPTH: int = int(os.getenv("SHED_QUEUE_DEPTH", max(1, INFERENCE_QUEUE_SIZE // 4)))
+    SHED_P95_LATENCY_MS: float = float(os.getenv("SHED_P95_LATENCY_MS", 3000))
+    SHED_LATENCY_WINDOW_SECONDS: float = float(os.getenv("SHED_LATENCY_WINDOW_SECONDS", 30))  # p95 延迟的统计窗口（秒）
+    
+    # ==================== 会话背压配置 ====================
+    # 每个会话尚未识别的音频上限（秒），超出时暂停接收该连接的数据，等待识别追上
+    MAX_PENDING_AUDIO_SECONDS: float = float(os.getenv("MAX_PENDING_AUDIO_SECONDS", 3))
+    STREAMING_MAX_COALESCE: int = int(os.getenv("STREAMING_MAX_COALESCE", 8))  # 积压时单次推理最多合并的流式块数
+    # 积压时只发送最新的部分结果；松开按钮后剩余音频不再产生部分结果，直接作为最终识别的最后一块
+    DROP_STALE_PARTIALS: bool = os.getenv("DROP_STALE_PARTIALS", "true").lower() == "true"
+    # 每个会话每秒最多发送的部分结果数（流式识别，0 表示不限制），超出时只发送最新的结果
+    PARTIAL_MAX_PER_SECOND: float = float(os.getenv("PARTIAL_MAX_PER_SECOND", 5))
+    
+    @classmethod
+    def torch_threads_per_worker(cls) -> int:
+        """每个推理线程可用的 PyTorch 线程数（TORCH_NUM_THREADS 按工作进程和推理线程均分）"""
+        return max(1, cls.TORCH_NUM_THREADS // cls.WORKERS // cls.INFERENCE_WORKERS)
+    
     @classmethod
-    def setup_torch_threads(cls):
-        """设置 PyTorch 线程数以优化 CPU 性能"""
-        import torch
-        torch.set_num_threads(cls.TORCH_NUM_THREADS)
+    def setup_torch_threads(cls) -> bool:
+        """
+        设置 PyTorch 线程数以优化 CPU 性能（按进程和推理线程数均分，避免线程超额订阅）
+        
+        Returns:
+            是否已设置（未安装 torch 时跳过）
+        """
         os.environ["OMP_NUM_THREADS"] = str(cls.OMP_NUM_THREADS)
         os.environ["MKL_NUM_THREADS"] = str(cls.MKL_NUM_THREADS)
+        try:
+            import torch
+        except ImportError:
+            return False
+        torch.set_num_threads(cls.torch_threads_per_worker())
+        return True
 
 
 # 创建全局配置实例
@@ -0,0 +1,111 @@
+"""
+推理后端一致性检查
+分别用 PyTorch（FunASR AutoModel）和 ONNX Runtime 后端流式识别同一段音频，比较识别结果和耗时
+
+用法:
+    python parity_check.py fixture.wav
+    python parity_check.py fixture.wav --max-cer 0.05 --no-quantize
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from config import config
+
+SAMPLE_RATE = 16000
+
+
+def load_fixture(path: str) -> np.ndarray:
+    """读取 16kHz 单声道音频为 float32"""
+    import soundfile
+
+    audio, sample_rate = soundfile.read(path, dtype="float32", always_2d=True)
+    if sample_rate != SAMPLE_RATE:
+        raise ValueError(f"{path}: 仅支持 {SAMPLE_RATE}Hz 音频（当前 {sample_rate}Hz）")
+    return audio.mean(axis=1)
+
+
+def stream_decode(model, audio: np.ndarray, chunk_size: list) -> dict:
+    """按服务端相同的块长和参数流式识别整段音频"""
+    stride = int(chunk_size[1] * 0.06 * SAMPLE_RATE)
+    cache = {}
+    text = ""
+    start = time.perf_counter()
+    for offset in range(0, len(audio), stride):
+        result = model.generate(
+            input=audio[offset:offset + stride],
+            cache=cache,
+            is_final=offset + stride >= len(audio),
+            chunk_size=chunk_size,
+            encoder_chunk_look_back=config.ENCODER_CHUNK_LOOK_BACK,
+            decoder_chunk_look_back=config.DECODER_CHUNK_LOOK_BACK,
+            disable_pbar=True
+        )
+        text += result[0].get("text", "") if result else ""
+    elapsed = time.perf_counter() - start
+    return {
+        "text": text,
+        "seconds": round(elapsed, 3),
+        "rtf": round(elapsed / (len(audio) / SAMPLE_RATE), 4)
+    }
+
+
+def edit_distance(a: str, b: str) -> int:
+    """字符级编辑距离"""
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较 PyTorch 与 ONNX 推理后端的识别结果")
+    parser.add_argument("wav", help="16kHz 单声道测试音频")
+    parser.add_argument("--max-cer", type=float, default=0.05, help="允许的最大字符差异率（以 PyTorch 结果为参考）")
+    parser.add_argument("--no-quantize", action="store_true", help="使用 fp32 ONNX 模型")
+    args = parser.parse_args(argv)
+
+    from funasr import AutoModel
+    from app import OnnxStreamingModel
+
+    audio = load_fixture(args.wav)
+    chunk_size = config.STREAMING_CHUNK_SIZE
+
+    torch_model = AutoModel(model=config.MODEL_NAME, model_revision=config.MODEL_REVISION, device="cpu")
+    onnx_model = OnnxStreamingModel(
+        model_dir=config.ONNX_MODEL_DIR,
+        chunk_size=chunk_size,
+        quantize=not args.no_quantize,
+        intra_op_threads=config.ONNX_INTRA_OP_THREADS or config.torch_threads_per_worker(),
+        inter_op_threads=config.ONNX_INTER_OP_THREADS
+    )
+
+    reference = stream_decode(torch_model, audio, chunk_size)
+    candidate = stream_decode(onnx_model, audio, chunk_size)
+
+    distance = edit_distance(reference["text"], candidate["text"])
+    cer = distance / max(1, len(reference["text"]))
+    report = {
+        "fixture": args.wav,
+        "audio_seconds": round(len(audio) / SAMPLE_RATE, 2),
+        "quantize": not args.no_quantize,
+        "torch": reference,
+        "onnx": candidate,
+        "exact_match": reference["text"] == candidate["text"],
+        "edit_distance": distance,
+        "cer": round(cer, 4),
+        "speedup": round(reference["seconds"] / candidate["seconds"], 2) if candidate["seconds"] else None
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if cer <= args.max_cer else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
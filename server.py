@@ -0,0 +1,169 @@
+"""
+多进程启动器
+模型在父进程中加载一次，fork 出的工作进程以写时复制方式共享模型权重
+WORKERS=1 时不 fork，直接在本进程中运行 uvicorn，模型由应用启动后在后台加载
+
+用法:
+    WORKERS=4 python server.py
+"""
+
+import gc
+import glob
+import os
+import signal
+import socket
+import sys
+import tempfile
+
+from config import config
+
+# 多进程模式下 Prometheus 指标写入共享目录，须在导入 app（及 prometheus_client）之前设置
+if config.WORKERS > 1:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # 用户指定的目录可能还存放其他文件：只清理上次运行遗留的指标文件
+        metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+            os.remove(path)
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="asr-metrics-")
+
+import uvicorn  # noqa: E402
+
+import app as asr_app  # noqa: E402
+from app import logger  # noqa: E402
+
+# 工作进程 PID -> 槽位编号
+workers = {}
+stopping = False
+
+
+def create_socket() -> socket.socket:
+    """创建由所有工作进程共享的监听套接字"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((config.HOST, config.PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def create_server() -> uvicorn.Server:
+    """创建运行 FastAPI 应用的 uvicorn 服务"""
+    return uvicorn.Server(uvicorn.Config(
+        asr_app.app,
+        log_level=config.LOG_LEVEL.lower(),
+        access_log=True
+    ))
+
+
+def run_worker(index: int, sock: socket.socket):
+    """工作进程入口：设置本进程的线程数后运行 uvicorn"""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    
+    # 日志后台线程不会被 fork 继承
+    asr_app.start_log_listener()
+    
+    asr_app.connection_limiter.worker_index = index
+    asr_app.recording_limiter.worker_index = index
+    
+    try:
+        create_server().run(sockets=[sock])
+    finally:
+        asr_app.stop_log_listener()
+
+
+def spawn_worker(index: int, sock: socket.socket):
+    """fork 一个工作进程"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(index, sock)
+        finally:
+            os._exit(0)
+    
+    workers[pid] = index
+    logger.info(f"工作进程 {index} 已启动 (PID: {pid})")
+
+
+def handle_stop(signum, frame):
+    """停止信号：转发给所有工作进程"""
+    global stopping
+    stopping = True
+    for pid in list(workers):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def main():
+    # 先绑定端口再加载模型：加载期间的连接在监听队列中等待，而不是被拒绝
+    sock = create_socket()
+    logger.info(f"监听地址: {config.HOST}:{config.PORT}")
+    
+    if config.WORKERS <= 1:
+        # 单进程无需在 fork 前共享模型：直接运行 uvicorn，模型在应用启动后于后台加载，期间存活检查正常响应
+        logger.info("单进程模式")
+        create_server().run(sockets=[sock])
+        return
+    
+    logger.info("=" * 60)
+    logger.info(f"多进程模式: {config.WORKERS} 个工作进程")
+    logger.info("=" * 60)
+    
+    if config.ASR_BACKEND == "torch" or config.VAD_MODEL or config.TWO_PASS_MODEL or config.PUNC_MODEL:
+        # 父进程只加载模型、不做推理：限制为单线程，避免 fork 前创建 OpenMP 线程池
+        import torch
+        torch.set_num_threads(1)
+    
+    if config.ASR_BACKEND == "torch":
+        asr_app.load_models()
+    else:
+        # onnxruntime 推理会话创建时即启动线程池，fork 后不可用：由各工作进程启动时自行加载（量化模型体积较小）
+        # 辅助模型（VAD、两遍识别、标点等）仍使用 PyTorch，在父进程中加载一次供所有工作进程共享
+        asr_app.load_auxiliary_models()
+        logger.info("ONNX 后端：识别模型由各工作进程分别加载")
+    
+    # 冻结已有对象，避免工作进程中的垃圾回收触碰模型对象所在内存页，破坏写时复制
+    gc.collect()
+    gc.freeze()
+    
+    signal.signal(signal.SIGINT, handle_stop)
+    signal.signal(signal.SIGTERM, handle_stop)
+    
+    for index in range(config.WORKERS):
+        spawn_worker(index, sock)
+    
+    # 监控工作进程，异常退出时重新 fork（模型仍在父进程内存中，无需重新加载）
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        
+        index = workers.pop(pid, None)
+        if index is None:
+            continue
+        
+        asr_app.connection_limiter.reset_worker(index)
+        asr_app.recording_limiter.reset_worker(index)
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid)
+        
+        if not stopping:
+            logger.warning(f"工作进程 {index} 异常退出 (PID: {pid}, 状态: {status})，正在重启...")
+            spawn_worker(index, sock)
+    
+    sock.close()
+    logger.info("所有工作进程已退出")
+
+
+if __name__ == "__main__":
+    if not hasattr(os, "fork"):
+        sys.exit("多进程模式需要支持 fork 的操作系统（Linux/macOS），Windows 请使用 python app.py")
+    main()
@@ -8,10 +8,23 @@ import websockets
 import json
 import time
 import base64
+import urllib.request
 import numpy as np
+from typing import Tuple
 
 # WebSocket 服务器地址
 WS_URL = "ws://localhost:9999/ws/asr"
+# HTTP 服务地址（用于读取 /stats）
+HTTP_URL = "http://localhost:9999"
+
+
+async def recv_status(websocket) -> dict:
+    """接收下一条状态/错误消息（识别与状态消息异步发送，跳过期间到达的识别结果）"""
+    while True:
+        data = json.loads(await websocket.recv())
+        if data.get("type") != "result":
+            return data
+        print(f"   识别结果({data.get('mode')}): {data.get('text')}")
 
 
 async def test_basic_connection():
@@ -62,8 +75,7 @@ async def test_control_commands():
             "command": "stop",
             "timestamp": int(time.time() * 1000)
         }))
-        response = await websocket.recv()
-        data = json.loads(response)
+        data = await recv_status(websocket)
         print(f"✓ Stop 响应: {data}")
         
         await asyncio.sleep(0.5)
@@ -75,8 +87,7 @@ async def test_control_commands():
             "command": "reset",
             "timestamp": int(time.time() * 1000)
         }))
-        response = await websocket.recv()
-        data = json.loads(response)
+        data = await recv_status(websocket)
         print(f"✓ Reset 响应: {data}")
         
         print("✓ 控制指令测试通过\n")
@@ -169,8 +180,15 @@ async def test_full_workflow():
             "command": "stop",
             "timestamp": int(time.time() * 1000)
         }))
-        response = await websocket.recv()
-        print(f"   响应: {json.loads(response)['message']}")
+        data = await recv_status(websocket)
+        print(f"   响应: {data['message']}")
+        
+        # 等待最终结果
+        while True:
+            result = json.loads(await asyncio.wait_for(websocket.recv(), timeout=30.0))
+            if result.get("type") == "result" and result.get("mode") == "final":
+                print(f"   最终结果: {result.get('text')}")
+                break
         
         print("\n✓ 完整工作流程测试通过\n")
 
@@ -245,6 +263,202 @@ async def test_invalid_messages():
         print("✓ 无效消息处理测试通过\n")
 
 
+def fetch_stats() -> dict:
+    """读取服务端统计信息"""
+    with urllib.request.urlopen(f"{HTTP_URL}/stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+async def send_utterance(framing: str, audio_seconds: int = 5, frame_ms: int = 100) -> int:
+    """
+    以指定帧格式发送一段完整话语，等待最终结果
+    
+    Returns:
+        发送的音频负载字节数
+    """
+    url = WS_URL if framing == "json" else f"{WS_URL}?framing=binary"
+    samples_per_frame = 16000 * frame_ms // 1000
+    sent_bytes = 0
+    
+    async with websockets.connect(url) as websocket:
+        data = json.loads(await websocket.recv())
+        assert data.get("framing", "json") == framing, f"帧格式协商失败: {data}"
+        
+        await websocket.send(json.dumps({
+            "type": "control",
+            "command": "start",
+            "timestamp": int(time.time() * 1000)
+        }))
+        await websocket.recv()
+        
+        for _ in range(audio_seconds * 1000 // frame_ms):
+            audio_data = np.random.randint(-5000, 5000, samples_per_frame, dtype=np.int16)
+            if framing == "binary":
+                payload = audio_data.tobytes()
+            else:
+                payload = json.dumps({
+                    "type": "audio",
+                    "data": base64.b64encode(audio_data.tobytes()).decode(),
+                    "timestamp": int(time.time() * 1000)
+                })
+            await websocket.send(payload)
+            sent_bytes += len(payload)
+        
+        await websocket.send(json.dumps({
+            "type": "control",
+            "command": "stop",
+            "timestamp": int(time.time() * 1000)
+        }))
+        
+        # 等待最终结果
+        while True:
+            result = json.loads(await asyncio.wait_for(websocket.recv(), timeout=30.0))
+            if result.get("type") == "result" and result.get("mode") == "final":
+                break
+    
+    return sent_bytes
+
+
+async def test_framing_comparison():
+    """对比 JSON/base64 与二进制帧的传输字节数和服务端 CPU 开销"""
+    print("=" * 60)
+    print("测试 7: 音频帧格式对比（json vs binary）")
+    print("=" * 60)
+    
+    audio_seconds = 5
+    results = {}
+    for framing in ("json", "binary"):
+        cpu_before = fetch_stats().get("cpu_time_s", 0.0)
+        sent_bytes = await send_utterance(framing, audio_seconds=audio_seconds)
+        cpu_after = fetch_stats().get("cpu_time_s", 0.0)
+        
+        cpu_per_second = (cpu_after - cpu_before) / audio_seconds * 1000
+        results[framing] = sent_bytes
+        print(
+            f"✓ {framing:>6}: 传输 {sent_bytes} 字节 "
+            f"({sent_bytes / audio_seconds / 1024:.1f} KB/s 音频)，"
+            f"服务端 CPU {cpu_per_second:.1f}ms/s 音频"
+        )
+    
+    saving = 1 - results["binary"] / results["json"]
+    print(f"\n✓ 二进制帧节省传输字节 {saving:.1%}")
+    print("✓ 音频帧格式对比测试通过\n")
+
+
+async def receive_utterance(encoding: str, audio_seconds: int = 5, frame_ms: int = 100) -> Tuple[int, int]:
+    """
+    以指定消息编码发送一段完整话语，统计收到的服务端消息
+    
+    Returns:
+        (收到的消息数, 收到的字节数)
+    """
+    import msgpack
+    
+    def decode(message):
+        return msgpack.unpackb(message) if encoding == "msgpack" else json.loads(message)
+    
+    samples_per_frame = 16000 * frame_ms // 1000
+    received = []
+    
+    async with websockets.connect(f"{WS_URL}?framing=binary&encoding={encoding}") as websocket:
+        data = decode(await websocket.recv())
+        assert data.get("encoding") == encoding, f"消息编码协商失败: {data}"
+        
+        await websocket.send(json.dumps({"type": "control", "command": "start"}))
+        for _ in range(audio_seconds * 1000 // frame_ms):
+            await websocket.send(np.random.randint(-5000, 5000, samples_per_frame, dtype=np.int16).tobytes())
+        await websocket.send(json.dumps({"type": "control", "command": "stop"}))
+        
+        while True:
+            message = await asyncio.wait_for(websocket.recv(), timeout=30.0)
+            received.append(len(message.encode("utf-8") if isinstance(message, str) else message))
+            result = decode(message)
+            if result.get("type") == "result" and result.get("mode") == "final":
+                break
+    
+    return len(received), sum(received)
+
+
+async def test_encoding_comparison():
+    """对比 JSON 与 msgpack 消息编码的下行字节数"""
+    print("=" * 60)
+    print("测试 8: 消息编码对比（json vs msgpack）")
+    print("=" * 60)
+    
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        print("⚠ 未安装 msgpack，跳过\n")
+        return
+    
+    results = {}
+    for encoding in ("json", "msgpack"):
+        count, size = await receive_utterance(encoding)
+        results[encoding] = size / count
+        print(f"✓ {encoding:>7}: {count} 条消息，共 {size} 字节（平均 {size / count:.1f} 字节/条）")
+    
+    saving = 1 - results["msgpack"] / results["json"]
+    print(f"\n✓ msgpack 平均每条消息节省 {saving:.1%}")
+    print("✓ 消息编码对比测试通过\n")
+
+
+async def receive_partials(result_mode: str, audio_seconds: int = 5, frame_ms: int = 100) -> Tuple[int, int]:
+    """
+    以指定部分结果格式发送一段完整话语，增量模式下按 offset 还原完整文本
+    
+    Returns:
+        (收到的部分结果数, 部分结果的字节数)
+    """
+    samples_per_frame = 16000 * frame_ms // 1000
+    count, size = 0, 0
+    text = ""
+    
+    async with websockets.connect(f"{WS_URL}?framing=binary&results={result_mode}") as websocket:
+        data = json.loads(await websocket.recv())
+        assert data.get("results") == result_mode, f"结果格式协商失败: {data}"
+        
+        await websocket.send(json.dumps({"type": "control", "command": "start"}))
+        for _ in range(audio_seconds * 1000 // frame_ms):
+            await websocket.send(np.random.randint(-5000, 5000, samples_per_frame, dtype=np.int16).tobytes())
+            await asyncio.sleep(frame_ms / 1000)
+        await websocket.send(json.dumps({"type": "control", "command": "stop"}))
+        
+        while True:
+            message = await asyncio.wait_for(websocket.recv(), timeout=30.0)
+            result = json.loads(message)
+            if result.get("type") != "result":
+                continue
+            if result.get("mode") == "final":
+                break
+            count += 1
+            size += len(message.encode("utf-8"))
+            if result_mode == "delta":
+                assert result["offset"] <= len(text), f"增量结果的 offset 超出上一条结果: {result}"
+                text = text[:result["offset"]] + result["text"]
+            else:
+                text = result["text"]
+            print(f"  部分结果: {text}")
+    
+    return count, size
+
+
+async def test_delta_results():
+    """对比完整文本与增量部分结果的下行字节数"""
+    print("=" * 60)
+    print("测试 9: 部分结果格式对比（full vs delta）")
+    print("=" * 60)
+    
+    results = {}
+    for result_mode in ("full", "delta"):
+        count, size = await receive_partials(result_mode)
+        results[result_mode] = size
+        print(f"✓ {result_mode:>5}: {count} 条部分结果，共 {size} 字节")
+    
+    if results["full"]:
+        print(f"\n✓ 增量结果节省下行字节 {1 - results['delta'] / results['full']:.1%}")
+    print("✓ 部分结果格式对比测试通过\n")
+
+
 async def run_all_tests():
     """运行所有测试"""
     print("\n")
@@ -261,6 +475,9 @@ async def run_all_tests():
         await test_full_workflow()
         await test_multiple_connections()
         await test_invalid_messages()
+        await test_framing_comparison()
+        await test_encoding_comparison()
+        await test_delta_results()
         
         # 测试总结
         print("=" * 60)